@@ -5,3 +5,14 @@ A modular Python package for migrating data from Racktables to NetBox.
 """
 
 __version__ = '1.0.0'
+
+# Migration stages imported on first attribute access (PEP 562)
+_lazy_submodules = ("vlans", "vms", "devices", "sites", "interfaces", "ips", "extended")
+
+def __getattr__(name):
+    if name in _lazy_submodules:
+        import importlib
+        module = importlib.import_module(f"{__name__}.{name}")
+        globals()[name] = module
+        return module
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
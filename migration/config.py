@@ -3,7 +3,6 @@ Global configuration settings for the Racktables to NetBox migration tool
 """
 from pymysql.cursors import DictCursor
 import os
-import ipaddress
 
 # Migration flags - control which components are processed
 CREATE_VLAN_GROUPS =           True
@@ -57,6 +56,9 @@ NB_PORT = int(os.environ.get('NETBOX_PORT', '8000'))
 NB_TOKEN = os.environ.get('NETBOX_TOKEN', '0123456789abcdef0123456789abcdef01234567')
 NB_USE_SSL = os.environ.get('NETBOX_USE_SSL', 'False').lower() in ('true', '1', 'yes')
 
+# Print a progress line for every object created, instead of only summary counts
+VERBOSE = os.environ.get('RT2NB_VERBOSE', 'False').lower() in ('true', '1', 'yes')
+
 # Database connection parameters - can be overridden with environment variables
 DB_CONFIG = {
     'host': os.environ.get('RACKTABLES_DB_HOST', '192.168.11.29'),
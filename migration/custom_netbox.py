@@ -4,6 +4,12 @@ It wraps the pynetbox client to provide a compatible interface with the original
 """
 
 import pynetbox
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# Connection pool sizes for the HTTP session shared by all API calls
+POOL_CONNECTIONS = 32
+POOL_MAXSIZE = 32
 
 
 class NetBoxWrapper:
@@ -20,6 +26,14 @@ class NetBoxWrapper:
 
         self.nb = pynetbox.api(url, token=auth_token)
 
+        # Reuse pooled keep-alive connections for every request. Idempotent
+        # requests are retried on rate limiting and gateway errors.
+        adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE,
+                              max_retries=Retry(total=3, backoff_factor=0.3,
+                                                status_forcelist=(429, 502, 503, 504)))
+        self.nb.http_session.mount("http://", adapter)
+        self.nb.http_session.mount("https://", adapter)
+
         # Create API endpoints that match the original library structure
         self.dcim = DcimWrapper(self.nb)
         self.ipam = IpamWrapper(self.nb)
@@ -42,14 +56,26 @@ class DcimWrapper:
 
     def get_sites(self, **kwargs):
         """Get sites with optional filters"""
+        if not kwargs:
+            return self.nb.dcim.sites.all()
         return self.nb.dcim.sites.filter(**kwargs)
 
+    def get_site(self, **kwargs):
+        """Get a single site matching the filters, or None"""
+        return self.nb.dcim.sites.get(**kwargs)
+
     def create_site(self, name, slug, **kwargs):
         """Create a new site"""
         return self.nb.dcim.sites.create(name=name, slug=slug, **kwargs)
 
+    def create_sites(self, sites):
+        """Create several sites in one request from a list of dicts"""
+        return self.nb.dcim.sites.create(sites)
+
     def get_devices(self, **kwargs):
         """Get devices with optional filters"""
+        if not kwargs:
+            return self.nb.dcim.devices.all()
         return self.nb.dcim.devices.filter(**kwargs)
 
     def create_device(self, name, device_type, device_role, site_name, **kwargs):
@@ -86,6 +112,10 @@ class DcimWrapper:
         """Create a new device role"""
         return self.nb.dcim.device_roles.create(name=name, color=color, slug=slug, **kwargs)
 
+    def create_device_roles(self, device_roles):
+        """Create several device roles in one request from a list of dicts"""
+        return self.nb.dcim.device_roles.create(device_roles)
+
     def get_device_roles(self, **kwargs):
         """Get device roles with optional filters"""
         return self.nb.dcim.device_roles.filter(**kwargs)
@@ -94,6 +124,10 @@ class DcimWrapper:
         """Create a new manufacturer"""
         return self.nb.dcim.manufacturers.create(name=name, slug=slug, **kwargs)
 
+    def create_manufacturers(self, manufacturers):
+        """Create several manufacturers in one request from a list of dicts"""
+        return self.nb.dcim.manufacturers.create(manufacturers)
+
     def get_manufacturers(self, **kwargs):
         """Get manufacturers with optional filters"""
         return self.nb.dcim.manufacturers.filter(**kwargs)
@@ -111,6 +145,10 @@ class DcimWrapper:
             **kwargs
         )
 
+    def create_device_types(self, device_types):
+        """Create several device types in one request from a list of dicts"""
+        return self.nb.dcim.device_types.create(device_types)
+
     def get_device_types(self, **kwargs):
         """Get device types with optional filters"""
         return self.nb.dcim.device_types.filter(**kwargs)
@@ -155,6 +193,8 @@ class DcimWrapper:
 
     def get_device_bays(self, **kwargs):
         """Get device bays with optional filters"""
+        if not kwargs:
+            return self.nb.dcim.device_bays.all()
         return self.nb.dcim.device_bays.filter(**kwargs)
 
     def create_rack(self, name, site_name, **kwargs):
@@ -168,6 +208,10 @@ class DcimWrapper:
             **kwargs
         )
 
+    def create_racks(self, racks):
+        """Create several racks in one request from a list of dicts"""
+        return self.nb.dcim.racks.create(racks)
+
     def create_reservation(self, rack_num, units, description, user, **kwargs):
         """Create a rack reservation"""
         return self.nb.dcim.rack_reservations.create(
@@ -203,8 +247,14 @@ class IpamWrapper:
         """Create a new VLAN group"""
         return self.nb.ipam.vlan_groups.create(name=name, slug=slug, **kwargs)
 
+    def create_vlan_groups(self, vlan_groups):
+        """Create several VLAN groups in one request from a list of dicts"""
+        return self.nb.ipam.vlan_groups.create(vlan_groups)
+
     def get_vlan_groups(self, **kwargs):
         """Get VLAN groups with optional filters"""
+        if not kwargs:
+            return self.nb.ipam.vlan_groups.all()
         return self.nb.ipam.vlan_groups.filter(**kwargs)
         
     def create_ip_range(self, start_address, end_address, **kwargs):
@@ -228,6 +278,10 @@ class IpamWrapper:
 
         return self.nb.ipam.vlans.create(vid=vid, name=vlan_name, **kwargs)
 
+    def create_vlans(self, vlans):
+        """Create several VLANs in one request from a list of dicts"""
+        return self.nb.ipam.vlans.create(vlans)
+
     def create_ip_prefix(self, prefix, **kwargs):
         """Create a new IP prefix"""
         # Handle VLAN if it's a dict
@@ -237,6 +291,10 @@ class IpamWrapper:
 
         return self.nb.ipam.prefixes.create(prefix=prefix, **kwargs)
 
+    def create_ip_prefixes(self, prefixes):
+        """Create several IP prefixes in one request from a list of dicts"""
+        return self.nb.ipam.prefixes.create(prefixes)
+
     def get_ip_prefixes(self, **kwargs):
         """Get IP prefixes with optional filters"""
         if 'tag' in kwargs:
@@ -382,6 +440,10 @@ class TenancyWrapper:
         """Get tenants with optional filters"""
         return self.nb.tenancy.tenants.filter(**kwargs)
 
+    def get_tenant(self, **kwargs):
+        """Get a single tenant matching the filters, or None"""
+        return self.nb.tenancy.tenants.get(**kwargs)
+
     def create_tenant(self, name, slug, **kwargs):
         """Create a new tenant"""
         return self.nb.tenancy.tenants.create(name=name, slug=slug, **kwargs)
@@ -405,6 +467,10 @@ class ExtrasWrapper:
         """Create a new tag"""
         return self.nb.extras.tags.create(name=name, slug=slug, **kwargs)
 
+    def create_tags(self, tags):
+        """Create several tags in one request from a list of dicts"""
+        return self.nb.extras.tags.create(tags)
+
     def get_tags(self, **kwargs):
         """Get tags with optional filters"""
         return self.nb.extras.tags.filter(**kwargs)
@@ -1,6 +1,8 @@
 """
 Database helper functions for accessing Racktables data
 """
+import functools
+
 from migration.utils import get_db_connection, get_cursor
 from migration.config import INTERFACE_NAME_MAPPINGS
 
@@ -53,15 +55,15 @@ def getRowsAtSite(siteId):
     Returns:
         list: List of row dictionaries
     """
-    rows = []
     with get_db_connection() as connection:
         with get_cursor(connection) as cursor:
-            cursor.execute("SELECT child_entity_id FROM EntityLink WHERE parent_entity_type='location' AND parent_entity_id=%s AND child_entity_type='row'", (siteId,))
-            rowIds = cursor.fetchall()
-            for rowId in rowIds:
-                cursor.execute("SELECT id,name,label,asset_no,comment FROM Object WHERE id=%s", (rowId["child_entity_id"],))
-                rows += cursor.fetchall()
-    return rows
+            cursor.execute(
+                "SELECT o.id,o.name,o.label,o.asset_no,o.comment FROM EntityLink el "
+                "JOIN Object o ON o.id=el.child_entity_id "
+                "WHERE el.parent_entity_type='location' AND el.parent_entity_id=%s AND el.child_entity_type='row'",
+                (siteId,)
+            )
+            return list(cursor.fetchall())
 
 def getRacksAtRow(rowId):
     """
@@ -73,15 +75,15 @@ def getRacksAtRow(rowId):
     Returns:
         list: List of rack dictionaries
     """
-    racks = []
     with get_db_connection() as connection:
         with get_cursor(connection) as cursor:
-            cursor.execute("SELECT child_entity_id FROM EntityLink WHERE parent_entity_type='row' AND parent_entity_id=%s AND child_entity_type='rack'", (rowId,))
-            rackIds = cursor.fetchall()
-            for rackId in rackIds:
-                cursor.execute("SELECT id,name,label,asset_no,comment FROM Object WHERE id=%s", (rackId["child_entity_id"],))
-                racks += cursor.fetchall()
-    return racks
+            cursor.execute(
+                "SELECT o.id,o.name,o.label,o.asset_no,o.comment FROM EntityLink el "
+                "JOIN Object o ON o.id=el.child_entity_id "
+                "WHERE el.parent_entity_type='row' AND el.parent_entity_id=%s AND el.child_entity_type='rack'",
+                (rowId,)
+            )
+            return list(cursor.fetchall())
 
 def getAtomsAtRack(rackId):
     """
@@ -109,16 +111,22 @@ def getTags(entity_realm, entity_id):
     Returns:
         list: List of tag dictionaries
     """
-    tags = []
+    # Build fresh dicts from the cached names, since callers may modify the list
+    return [{'name': tag} for tag in _get_tag_names(entity_realm, entity_id)]
+
+@functools.lru_cache(maxsize=None)
+def _get_tag_names(entity_realm, entity_id):
+    """Get the tag names of an entity, remembered for repeated lookups"""
     with get_db_connection() as connection:
         with get_cursor(connection) as cursor:
-            cursor.execute("SELECT tag_id FROM TagStorage WHERE entity_id=%s AND entity_realm=%s", (entity_id, entity_realm))
-            tag_ids = [x["tag_id"] for x in cursor.fetchall()]
-            for tag_id in tag_ids:
-                cursor.execute("SELECT tag FROM TagTree WHERE id=%s", (tag_id,))
-                tags += cursor.fetchall()
-    return [{'name': tag["tag"]} for tag in tags]
-
+            cursor.execute(
+                "SELECT tt.tag FROM TagStorage ts JOIN TagTree tt ON tt.id=ts.tag_id "
+                "WHERE ts.entity_id=%s AND ts.entity_realm=%s",
+                (entity_id, entity_realm)
+            )
+            return tuple(tag["tag"] for tag in cursor.fetchall())
+
+@functools.lru_cache(maxsize=None)
 def getDeviceType(objtype_id):
     """
     Get the device type name for a given object type ID
@@ -172,6 +180,7 @@ def get_custom_fields(racktables_object_id, slugified_attributes=None, initial_d
 
     return custom_fields
 
+@functools.lru_cache(maxsize=None)
 def device_is_in_cluster(device_id):
     """
     Check if a device is in a VM cluster
@@ -180,21 +189,25 @@ def device_is_in_cluster(device_id):
         device_id: ID of the device
 
     Returns:
-        tuple: (is_in_cluster, cluster_name, parent_entity_ids)
+        tuple: (is_in_cluster, cluster_name, parent_entity_ids), with the
+            parent entity IDs as a tuple since results are cached
     """
+    # Read the parent links together with the parent objects, if they exist
     with get_db_connection() as connection:
         with get_cursor(connection) as cursor:
-            cursor.execute("SELECT parent_entity_id FROM EntityLink WHERE parent_entity_type=\"object\" AND child_entity_id=%s", (device_id,))
-            parent_entity_ids = [parent_entity_id["parent_entity_id"] for parent_entity_id in cursor.fetchall()]
-
-            for parent_entity_id in parent_entity_ids:
-                cursor.execute("SELECT objtype_id,name FROM Object WHERE id=%s", (parent_entity_id,))
-                result = cursor.fetchone()
-                if result:
-                    parent_objtype_id, parent_name = result["objtype_id"], result["name"]
-
-                    if parent_objtype_id == 1505:  # VM Cluster
-                        return True, parent_name, parent_entity_ids
+            cursor.execute(
+                "SELECT el.parent_entity_id,o.objtype_id,o.name FROM EntityLink el "
+                "LEFT JOIN Object o ON o.id=el.parent_entity_id "
+                "WHERE el.parent_entity_type=\"object\" AND el.child_entity_id=%s",
+                (device_id,)
+            )
+            parents = cursor.fetchall()
+
+    parent_entity_ids = tuple(parent["parent_entity_id"] for parent in parents)
+
+    for parent in parents:
+        if parent["objtype_id"] == 1505:  # VM Cluster
+            return True, parent["name"], parent_entity_ids
 
     return False, None, parent_entity_ids
 
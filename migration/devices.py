@@ -2,24 +2,53 @@
 Device creation and management functions
 """
 
-from racktables_netbox_migration.utils import pickleLoad, pickleDump
-from slugify import slugify
+import threading
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
 
-from racktables_netbox_migration.utils import (
-    get_db_connection, get_cursor, pickleDump, error_log
+from migration.utils import (
+    get_db_connection, get_cursor, pickleLoad, pickleDump, error_log, slugify, bulk_create,
+    verbose_print
 )
-from racktables_netbox_migration.db import (
+from migration.db import (
     getAtomsAtRack, getTags, get_hw_type, getDeviceType, get_custom_fields, device_is_in_cluster
 )
-from racktables_netbox_migration.config import (
+from migration.config import (
     PARENT_OBJTYPE_IDS, OBJTYPE_ID_NAMES, RACKTABLES_MANUFACTURERS,
-    PARENT_CHILD_OBJTYPE_ID_PAIRS, FIRST_ASCII_CHARACTER,
-    TARGET_TENANT, TARGET_TENANT_ID, TARGET_SITE
+    PARENT_CHILD_OBJTYPE_ID_PAIRS,
+    TARGET_TENANT_ID, TARGET_SITE
 )
 
+# Object types that can hold child devices, as a set for fast membership tests
+PARENT_OBJTYPE_ID_SET = frozenset(PARENT_OBJTYPE_IDS)
+
+def _pair_parent_objtype_ids():
+    """
+    Group PARENT_CHILD_OBJTYPE_ID_PAIRS by the object types they apply to
+
+    Returns:
+        dict: Object type ID mapped to a list, in pair order, holding the parent
+            object type ID for each pair where the type is the child, or None
+            where it is only the parent
+    """
+    pair_parents = {}
+    for parent_objtype_id, child_objtype_id in PARENT_CHILD_OBJTYPE_ID_PAIRS:
+        pair_parents.setdefault(child_objtype_id, []).append(parent_objtype_id)
+        if parent_objtype_id != child_objtype_id:
+            pair_parents.setdefault(parent_objtype_id, []).append(None)
+    return pair_parents
+
+PAIR_PARENT_OBJTYPE_IDS = _pair_parent_objtype_ids()
+
+# Number of devices of a rack created in NetBox at the same time
+DEVICE_CREATION_WORKERS = 8
+
+# Guards the names, locations and asset tags shared by concurrent device creations
+_device_state_lock = threading.Lock()
+
 # Global tracking of created objects
 global_names = set()
-global_devices = []
+global_devices_by_location = {}
 global_device_roles = set()
 global_manufacturers = set()
 global_device_types = set()
@@ -28,6 +57,28 @@ global_non_physical_object_ids = set()
 asset_tags = set()
 serials = dict()
 
+def save_device_state():
+    """
+    Save the device names, locations, types and asset tags known to exist in NetBox,
+    so a resumed run can skip fetching every device again
+    """
+    pickleDump("global_names", global_names)
+    pickleDump("global_devices_by_location", global_devices_by_location)
+    pickleDump("global_device_types", global_device_types)
+    pickleDump("asset_tags", asset_tags)
+
+def get_objects_by_id():
+    """
+    Read all Racktables objects in one query
+
+    Returns:
+        dict: Object rows keyed by object ID
+    """
+    with get_db_connection() as connection:
+        with get_cursor(connection, stream=True) as cursor:
+            cursor.execute("SELECT id,name,label,objtype_id,has_problems,comment,asset_no FROM Object")
+            return {row["id"]: row for row in cursor}
+
 def get_manufacturer_role_type(racktables_object_id, objtype_id, height, is_full_depth):
     """
     Determine manufacturer, role, and type for a device
@@ -60,6 +111,24 @@ def get_manufacturer_role_type(racktables_object_id, objtype_id, height, is_full
 
     return manufacturer, original_device_type, device_type_model
 
+def device_location_key(device):
+    """
+    Build the rack location key of an existing NetBox device
+
+    Args:
+        device: NetBox device record
+
+    Returns:
+        tuple: Key as used by create_device_at_location, or None if the device isn't racked
+    """
+    if not device['rack'] or not device['face']:
+        return None
+
+    return (
+        device['site']['name'], device['rack']['name'], device['face']['value'], device['position'],
+        device['device_role']['name'], device['device_type']['manufacturer']['name'], device['device_type']['model']
+    )
+
 def create_device_at_location(netbox, device_name, face, start_height, device_role, manufacturer,
                              device_type_model, site_name, rack_name, asset_no, racktables_device_id):
     """
@@ -81,36 +150,40 @@ def create_device_at_location(netbox, device_name, face, start_height, device_ro
     Returns:
         tuple: (device_name, device_id)
     """
-    global global_devices, global_names, global_device_roles, global_manufacturers, global_device_types, asset_tags
+    global global_names, global_device_roles, global_manufacturers, global_device_types, asset_tags
 
     # Check if device already exists at this location
-    name_at_location = None
-    id_at_location = None
-
-    for device in global_devices:
-        if (face == device['face']['value'] and start_height == device['position'] and
-            device_role == device['device_role']['name'] and
-            manufacturer == device['device_type']['manufacturer']['name'] and
-            device_type_model == device['device_type']['model'] and
-            site_name == device['site']['name'] and rack_name == device['rack']['name']):
-            name_at_location = device['name']
-            id_at_location = device['id']
-            break
-
-    if name_at_location is None:
-        # Use original name if unique, otherwise append counter
-        name_at_location = device_name
-
-        if device_name in global_names:
-            name_counter = 1
-            while True:
-                counter_name = device_name + ".{}".format(name_counter)
-                if counter_name not in global_names:
-                    name_at_location = counter_name
-                    break
-                else:
-                    name_counter += 1
+    location_key = (site_name, rack_name, face, start_height, device_role, manufacturer, device_type_model)
+    with _device_state_lock:
+        name_at_location, id_at_location = global_devices_by_location.get(location_key, (None, None))
+        exists_at_location = name_at_location is not None
+
+        if not exists_at_location:
+            # Use original name if unique, otherwise append counter
+            name_at_location = device_name
+
+            if device_name in global_names:
+                name_counter = 1
+                while True:
+                    counter_name = device_name + ".{}".format(name_counter)
+                    if counter_name not in global_names:
+                        name_at_location = counter_name
+                        break
+                    else:
+                        name_counter += 1
+
+            # Handle asset tag duplicates
+            asset_no = asset_no.strip() if asset_no else None
+            if asset_no and asset_no in asset_tags:
+                asset_no = asset_no + "-1"
 
+            # Reserve the name and asset tag while the device is being created
+            global_names.add(name_at_location)
+            reserved_asset_no = asset_no if asset_no and asset_no not in asset_tags else None
+            if reserved_asset_no:
+                asset_tags.add(reserved_asset_no)
+
+    if not exists_at_location:
         # Check if device is in a VM cluster
         device_in_vm_cluster, device_vm_cluster_name, parent_entity_ids = device_is_in_cluster(racktables_device_id)
 
@@ -120,11 +193,6 @@ def create_device_at_location(netbox, device_name, face, start_height, device_ro
         # Get serial number if available
         serial = serials[racktables_device_id] if racktables_device_id in serials else ""
 
-        # Handle asset tag duplicates
-        asset_no = asset_no.strip() if asset_no else None
-        if asset_no and asset_no in asset_tags:
-            asset_no = asset_no + "-1"
-
         # Add tenant parameter if TARGET_TENANT_ID is specified
         tenant_param = {}
         if TARGET_TENANT_ID:
@@ -148,30 +216,34 @@ def create_device_at_location(netbox, device_name, face, start_height, device_ro
                 **tenant_param  # Add tenant parameter
             )
 
-            if asset_no:
-                asset_tags.add(asset_no)
-
             id_at_location = device['id']
-            global_names.add(name_at_location)
-            global_devices.append(device)
+            with _device_state_lock:
+                global_devices_by_location[location_key] = (name_at_location, id_at_location)
 
-            print(f"Created device {name_at_location} at {rack_name} U{start_height} {face}")
+            verbose_print(f"Created device {name_at_location} at {rack_name} U{start_height} {face}")
         except Exception as e:
             error_log(f"Error creating device {name_at_location}: {str(e)}")
+            with _device_state_lock:
+                global_names.discard(name_at_location)
+                if reserved_asset_no:
+                    asset_tags.discard(reserved_asset_no)
             return None, None
     else:
-        print(f"Device {name_at_location} already exists at location")
+        verbose_print(f"Device {name_at_location} already exists at location")
 
     return name_at_location, id_at_location
 
-def create_racked_devices(netbox):
+def create_racked_devices(netbox, resume=True):
     """
     Create devices in racks based on Racktables data
 
     Args:
         netbox: NetBox client instance
+        resume: Trust the device state saved by a previous run instead of reading
+            the existing devices from NetBox. The saved state is not checked
+            against NetBox, so pass False after devices were changed there.
     """
-    global global_physical_object_ids, global_device_roles, global_manufacturers, global_device_types
+    global global_names, global_physical_object_ids, global_device_roles, global_manufacturers, global_device_types
 
     print("Creating racked devices")
 
@@ -181,13 +253,30 @@ def create_racked_devices(netbox):
     if TARGET_TENANT_ID:
         device_filters["tenant_id"] = TARGET_TENANT_ID
     
-    global_devices = netbox.dcim.get_devices(**device_filters)
-    print(f"Got {len(global_devices)} existing devices")
-
-    global_names = set(device['name'] for device in global_devices)
+    global_devices_by_location.clear()
+    saved_devices_by_location = pickleLoad("global_devices_by_location", None) if resume else None
+    if saved_devices_by_location is not None:
+        # Resume from the devices saved by a previous run
+        global_devices_by_location.update(saved_devices_by_location)
+        global_names = pickleLoad("global_names", set())
+        global_device_types = pickleLoad("global_device_types", set())
+        print(f"Loaded {len(global_names)} existing devices from saved state")
+    else:
+        global_devices = netbox.dcim.get_devices(**device_filters)
+        print(f"Got {len(global_devices)} existing devices")
+
+        # Index the existing devices by rack location for create_device_at_location
+        global_names = set()
+        for device in global_devices:
+            global_names.add(device['name'])
+            location_key = device_location_key(device)
+            if location_key is not None:
+                global_devices_by_location.setdefault(location_key, (device['name'], device['id']))
+        global_device_types = set(device_type['model'] for device_type in netbox.dcim.get_device_types())
+    if resume:
+        asset_tags.update(pickleLoad("asset_tags", set()))
     global_device_roles = set(role['name'] for role in netbox.dcim.get_device_roles())
     global_manufacturers = set(manufacturer['name'] for manufacturer in netbox.dcim.get_manufacturers())
-    global_device_types = set(device_type['model'] for device_type in netbox.dcim.get_device_types())
 
     # Load serial numbers for devices
     with get_db_connection() as connection:
@@ -203,6 +292,9 @@ def create_racked_devices(netbox):
     
     racks = netbox.dcim.racks.filter(**rack_filters)
 
+    # Read the Racktables objects once instead of querying each device separately
+    objects_by_id = get_objects_by_id()
+
     # Process each rack and create devices
     for rack in racks:
         rack_name = rack['name']
@@ -221,12 +313,13 @@ def create_racked_devices(netbox):
 
         if atoms:
             # Create devices based on atoms
-            create_devices_in_rack(netbox, atoms, rack_name, site_name, rack['id'])
+            create_devices_in_rack(netbox, atoms, rack_name, site_name, rack['id'], objects_by_id)
 
     # Save tracking of physical devices for interface creation
     pickleDump("global_physical_object_ids", global_physical_object_ids)
+    save_device_state()
 
-def create_devices_in_rack(netbox, atoms, rack_name, site_name, rack_id):
+def create_devices_in_rack(netbox, atoms, rack_name, site_name, rack_id, objects_by_id=None):
     """
     Create devices in a rack based on atoms data
 
@@ -236,33 +329,35 @@ def create_devices_in_rack(netbox, atoms, rack_name, site_name, rack_id):
         rack_name: Rack name
         site_name: Site name
         rack_id: Rack ID in NetBox
+        objects_by_id: Racktables object rows keyed by ID, read from the database if not given
     """
-    # Put positions into dict based on Id
-    atoms_dict = {}
+    if objects_by_id is None:
+        objects_by_id = get_objects_by_id()
+
+    # Put positions into dict based on object ID
+    atoms_dict = defaultdict(list)
     for atom in atoms:
-        key = str(atom["object_id"])
-        if key not in atoms_dict:
-            atoms_dict[key] = [atom]
-        else:
-            atoms_dict[key].append(atom)
+        atoms_dict[atom["object_id"]].append(atom)
 
     # Find devices that may need to be split due to non-contiguous placement
     added_atom_objects = {}
     separated_Ids = False
 
-    # Process devices in the rack
-    for Id in atoms_dict:
+    # Devices to place, and the roles, manufacturers and types they need that
+    # are missing in NetBox, so those can be created together before the devices
+    placements = []
+    new_device_roles = {}
+    new_manufacturers = {}
+    new_device_types = {}
+
+    # Work out the devices in the rack
+    for real_id, object_atoms in atoms_dict.items():
         # Skip null ID (reservations)
-        if Id == "None":
+        if real_id is None:
             continue
 
-        real_id = int(Id)
-
         # Get device info from Racktables
-        with get_db_connection() as connection:
-            with get_cursor(connection) as cursor:
-                cursor.execute("SELECT id,name,label,objtype_id,has_problems,comment,asset_no FROM Object WHERE id=%s", (real_id,))
-                info = cursor.fetchone()
+        info = objects_by_id.get(real_id)
 
         if not info:
             continue
@@ -274,11 +369,25 @@ def create_devices_in_rack(netbox, atoms, rack_name, site_name, rack_id):
         # Get device tags
         device_tags = getTags("object", real_id)
 
+        # Collect the faces and unit range of the device in one pass
+        has_front = has_rear = False
+        start_height = end_height = None
+        for atom in object_atoms:
+            if atom["atom"] == 'front':
+                has_front = True
+            elif atom["atom"] == 'rear':
+                has_rear = True
+            unit_no = atom["unit_no"]
+            if start_height is None or unit_no < start_height:
+                start_height = unit_no
+            if end_height is None or unit_no > end_height:
+                end_height = unit_no
+
         # Determine face and depth
-        if 'rear' not in [atom["atom"] for atom in atoms_dict[Id]]:
+        if not has_rear:
             face = 'front'
             is_full_depth = False
-        elif 'front' not in [atom["atom"] for atom in atoms_dict[Id]]:
+        elif not has_front:
             face = 'rear'
             is_full_depth = False
         else:
@@ -286,50 +395,87 @@ def create_devices_in_rack(netbox, atoms, rack_name, site_name, rack_id):
             is_full_depth = True
 
         # Calculate height
-        start_height = min([atom["unit_no"] for atom in atoms_dict[Id]])
-        height = max([atom["unit_no"] for atom in atoms_dict[Id]]) - start_height + 1
+        height = end_height - start_height + 1
 
         # Get device details
         manufacturer, device_role, device_type_model = get_manufacturer_role_type(
             real_id, objtype_id, height, is_full_depth
         )
 
-        # Create device role if needed
-        if device_role not in global_device_roles:
-            netbox.dcim.create_device_role(device_role, "ffffff", slugify(device_role))
-            global_device_roles.add(device_role)
+        # Queue device role if needed
+        if device_role not in global_device_roles and device_role not in new_device_roles:
+            new_device_roles[device_role] = {"name": device_role, "color": "ffffff", "slug": slugify(device_role)}
 
-        # Create manufacturer if needed
-        if manufacturer not in global_manufacturers:
-            netbox.dcim.create_manufacturer(manufacturer, slugify(manufacturer))
-            global_manufacturers.add(manufacturer)
+        # Queue manufacturer if needed
+        if manufacturer not in global_manufacturers and manufacturer not in new_manufacturers:
+            new_manufacturers[manufacturer] = {"name": manufacturer, "slug": slugify(manufacturer)}
 
         # Adjust device type for parent devices
-        if objtype_id in PARENT_OBJTYPE_IDS:
+        if objtype_id in PARENT_OBJTYPE_ID_SET:
             device_type_model += "-parent"
 
-        # Create device type if needed
-        if device_type_model not in global_device_types:
-            netbox.dcim.create_device_type(
-                model=device_type_model,
-                manufacturer={"name": manufacturer},
-                slug=slugify(device_type_model),
-                u_height=height,
-                is_full_depth=is_full_depth,
-                tags=device_tags,
-                subdevice_role="parent" if objtype_id in PARENT_OBJTYPE_IDS else ""
-            )
-            global_device_types.add(device_type_model)
+        # Queue device type if needed
+        if device_type_model not in global_device_types and device_type_model not in new_device_types:
+            new_device_types[device_type_model] = {
+                "model": device_type_model,
+                "manufacturer": {"name": manufacturer},
+                "slug": slugify(device_type_model),
+                "u_height": height,
+                "is_full_depth": is_full_depth,
+                "tags": device_tags,
+                "subdevice_role": "parent" if objtype_id in PARENT_OBJTYPE_ID_SET else ""
+            }
+
+        placements.append((real_id, info, device_name, face, start_height, device_role, manufacturer, device_type_model, asset_no))
+
+    # Create the missing roles and manufacturers, then the types that refer to them
+    for device_role, _ in bulk_create(netbox.dcim.create_device_roles, list(new_device_roles.values()), "device role"):
+        global_device_roles.add(device_role["name"])
+    for manufacturer, _ in bulk_create(netbox.dcim.create_manufacturers, list(new_manufacturers.values()), "manufacturer"):
+        global_manufacturers.add(manufacturer["name"])
+    for device_type, _ in bulk_create(netbox.dcim.create_device_types, list(new_device_types.values()), "device type"):
+        global_device_types.add(device_type["model"])
+
+    # Devices sharing a name, location or asset tag with an earlier one in this rack
+    # are created after the others, so their names and tags resolve in order
+    concurrent_placements = []
+    later_placements = []
+    seen_keys = set()
+    for placement in placements:
+        real_id, info, device_name, face, start_height, device_role, manufacturer, device_type_model, asset_no = placement
+        keys = [
+            ("name", device_name),
+            ("location", face, start_height, device_role, manufacturer, device_type_model)
+        ]
+        if asset_no and asset_no.strip():
+            keys.append(("asset_tag", asset_no.strip()))
+        if any(key in seen_keys for key in keys):
+            later_placements.append(placement)
+        else:
+            concurrent_placements.append(placement)
+        seen_keys.update(keys)
 
-        # Create the device
-        device_name, device_id = create_device_at_location(
+    def place_device(placement):
+        real_id, info, device_name, face, start_height, device_role, manufacturer, device_type_model, asset_no = placement
+        return create_device_at_location(
             netbox, device_name, face, start_height, device_role, manufacturer,
             device_type_model, site_name, rack_name, asset_no, real_id
         )
 
+    # Create the devices, overlapping the NetBox requests of different devices
+    with ThreadPoolExecutor(max_workers=DEVICE_CREATION_WORKERS) as executor:
+        results = list(zip(concurrent_placements, executor.map(place_device, concurrent_placements)))
+    results.extend((placement, place_device(placement)) for placement in later_placements)
+
+    placed_count = 0
+    for placement, (device_name, device_id) in results:
+        info = placement[1]
         if device_name and device_id:
             # Store device information for interface creation
-            global_physical_object_ids.add((device_name, info["id"], device_id, objtype_id))
+            global_physical_object_ids.add((device_name, info["id"], device_id, info["objtype_id"]))
+            placed_count += 1
+
+    print(f"Placed {placed_count} devices in rack {rack_name}")
 
 def create_non_racked_devices(netbox):
     """
@@ -345,37 +491,63 @@ def create_non_racked_devices(netbox):
     # Load existing tracking of non-physical devices
     global_non_physical_object_ids = pickleLoad("global_non_physical_object_ids", set())
 
+    # Read the Racktables objects once, for the objects of each type and for
+    # looking up parent devices, instead of querying the database per type
+    objects_by_id = get_objects_by_id()
+    objects_by_type = {}
+    for obj in objects_by_id.values():
+        objects_by_type.setdefault(obj["objtype_id"], []).append(obj)
+
+    # Get existing data from NetBox once for all object types
+    # If tenant filtering is enabled, filter devices by tenant
+    device_filters = {}
+    if TARGET_TENANT_ID:
+        device_filters["tenant_id"] = TARGET_TENANT_ID
+
+    existing_device_names = set(device['name'].strip() for device in netbox.dcim.get_devices(**device_filters) if device['name'])
+
+    # Map the highest numbered "bay-N" of each parent device
+    existing_device_bays = {}
+    for device_bay in netbox.dcim.get_device_bays():
+        parent_name = device_bay['device']['name']
+        prefix, _, number = device_bay['name'].partition('-')
+        bay_number = int(number) if prefix == 'bay' and number.isdigit() else 0
+        existing_device_bays[parent_name] = max(existing_device_bays.get(parent_name, 0), bay_number)
+
     # Process each object type
     for objtype_id in OBJTYPE_ID_NAMES:
         print(f"Processing {OBJTYPE_ID_NAMES[objtype_id]} devices")
 
-        # Get all objects of this type from Racktables
-        with get_db_connection() as connection:
-            with get_cursor(connection) as cursor:
-                cursor.execute("SELECT id,name,label,asset_no,comment FROM Object WHERE objtype_id=%s", (objtype_id,))
-                objs = cursor.fetchall()
-
-        # Convert to the format expected by create_parent_child_devices
-        objs_list = [(obj["id"], obj["name"], obj["label"], obj["asset_no"], obj["comment"]) for obj in objs]
+        # Get all object rows of this type
+        objs_list = objects_by_type.get(objtype_id, [])
 
         # Create devices
-        children_without_parents = create_parent_child_devices(netbox, objs_list, objtype_id)
+        children_without_parents = create_parent_child_devices(
+            netbox, objs_list, objtype_id, existing_device_names, existing_device_bays, objects_by_id
+        )
 
         # Try again for children whose parents weren't created yet
         if children_without_parents:
-            create_parent_child_devices(netbox, children_without_parents, objtype_id)
+            create_parent_child_devices(
+                netbox, children_without_parents, objtype_id, existing_device_names, existing_device_bays, objects_by_id
+            )
 
     # Save tracking of non-physical devices for interface creation
     pickleDump("global_non_physical_object_ids", global_non_physical_object_ids)
+    save_device_state()
 
-def create_parent_child_devices(netbox, data, objtype_id):
+def create_parent_child_devices(netbox, data, objtype_id, existing_device_names, existing_device_bays, objects_by_id):
     """
     Create devices and establish parent-child relationships
 
     Args:
         netbox: NetBox client instance
-        data: List of device data tuples
+        data: List of Racktables object rows
         objtype_id: Object type ID
+        existing_device_names: Set of device names in NetBox, updated with created devices
+        existing_device_bays: Dictionary mapping parent device names to their highest
+            bay number, updated with created bays
+        objects_by_id: Racktables object rows keyed by ID
 
     Returns:
         list: Devices that couldn't be created due to missing parents
@@ -384,25 +556,14 @@ def create_parent_child_devices(netbox, data, objtype_id):
 
     # Track devices that couldn't be created due to missing parents
     not_created_parents = []
-
-    # Get existing data from NetBox
-    # If tenant filtering is enabled, filter devices by tenant
-    device_filters = {}
-    if TARGET_TENANT_ID:
-        device_filters["tenant_id"] = TARGET_TENANT_ID
-        
-    existing_device_names = set(device['name'].strip() for device in netbox.dcim.get_devices(**device_filters) if device['name'])
-
-    # Map device bay names by parent device
-    existing_device_bays = {}
-    for device_bay in netbox.dcim.get_device_bays():
-        parent_name = device_bay['device']['name']
-        if parent_name not in existing_device_bays:
-            existing_device_bays[parent_name] = set()
-        existing_device_bays[parent_name].add(device_bay['name'])
+    created_count = 0
 
     # Process each device
-    for racktables_device_id, object_name, label, asset_no, comment in data:
+    for row in data:
+        racktables_device_id, object_name, label, asset_no, comment = (
+            row["id"], row["name"], row["label"], row["asset_no"], row["comment"]
+        )
+
         # Skip if no name
         if not object_name:
             continue
@@ -431,25 +592,22 @@ def create_parent_child_devices(netbox, data, objtype_id):
         is_child_parent_name = None
 
         # Check for parent-child relationships
-        for parent_from_pairs_objtype_id, child_from_pairs_objtype_id in PARENT_CHILD_OBJTYPE_ID_PAIRS:
-            if objtype_id == child_from_pairs_objtype_id:
+        for parent_from_pairs_objtype_id in PAIR_PARENT_OBJTYPE_IDS.get(objtype_id, ()):
+            if parent_from_pairs_objtype_id is not None:
                 # Check for parent
                 for parent_entity_id in parent_entity_ids:
-                    with get_db_connection() as connection:
-                        with get_cursor(connection) as cursor:
-                            cursor.execute("SELECT objtype_id,name FROM Object WHERE id=%s", (parent_entity_id,))
-                            result = cursor.fetchone()
-                            if result and result["objtype_id"] == parent_from_pairs_objtype_id:
-                                is_child = True
-                                is_child_parent_name = result["name"].strip()
-                                break
+                    result = objects_by_id.get(parent_entity_id)
+                    if result and result["objtype_id"] == parent_from_pairs_objtype_id:
+                        is_child = True
+                        is_child_parent_name = result["name"].strip()
+                        break
 
                 if is_child:
                     device_type_model += "-child"
                     subdevice_role = "child"
                     break
 
-            elif objtype_id == parent_from_pairs_objtype_id:
+            else:
                 is_parent = True
                 device_type_model += "-parent"
                 subdevice_role = "parent"
@@ -504,8 +662,11 @@ def create_parent_child_devices(netbox, data, objtype_id):
                 asset_tags.add(asset_no)
 
             # Track created device
+            existing_device_names.add(object_name)
+            global_names.add(object_name)
             global_non_physical_object_ids.add((object_name, racktables_device_id, device['id'], objtype_id))
-            print(f"Created non-racked device: {object_name}")
+            created_count += 1
+            verbose_print(f"Created non-racked device: {object_name}")
 
             # Handle child device in parent's device bay
             if is_child and is_child_parent_name:
@@ -515,14 +676,7 @@ def create_parent_child_devices(netbox, data, objtype_id):
                     parent_device = parent_devices[0]
 
                     # Determine new bay name
-                    if is_child_parent_name in existing_device_bays:
-                        try:
-                            new_bay_number = max(int(bay.split('-')[1]) for bay in existing_device_bays[is_child_parent_name]) + 1
-                        except ValueError:
-                            new_bay_number = 1
-                    else:
-                        new_bay_number = 1
-
+                    new_bay_number = existing_device_bays.get(is_child_parent_name, 0) + 1
                     new_bay_name = f"bay-{new_bay_number}"
 
                     # Create device bay
@@ -532,13 +686,14 @@ def create_parent_child_devices(netbox, data, objtype_id):
                             device_id=parent_device['id'],
                             installed_device_id=device['id']
                         )
-                        existing_device_bays.setdefault(is_child_parent_name, set()).add(new_bay_name)
-                        print(f"Added {object_name} to {is_child_parent_name} in bay {new_bay_name}")
+                        existing_device_bays[is_child_parent_name] = new_bay_number
+                        verbose_print(f"Added {object_name} to {is_child_parent_name} in bay {new_bay_name}")
                     except Exception as e:
                         error_log(f"Error creating device bay for {object_name}: {str(e)}")
 
         except Exception as e:
             error_log(f"Error creating device {object_name}: {str(e)}")
-            not_created_parents.append((racktables_device_id, object_name, label, asset_no, comment))
+            not_created_parents.append(row)
 
+    print(f"Created {created_count} {OBJTYPE_ID_NAMES[objtype_id]} devices")
     return not_created_parents
@@ -3,15 +3,20 @@ Functions for creating available subnet prefixes with improved detection
 """
 import ipaddress
 import requests
-from migration.utils import error_log, ensure_tag_exists
-from migration.config import NB_HOST, NB_PORT, NB_TOKEN, NB_USE_SSL, TARGET_TENANT_ID
+from migration.utils import error_log, ensure_tag_exists, bulk_create, record_field, verbose_print
+from migration.config import NB_HOST, NB_PORT, NB_TOKEN, NB_USE_SSL
 
-def create_available_prefixes(netbox):
+# Prefix lengths of the available subnets suggested in each gap
+AVAILABLE_SUBNET_SIZES_V4 = (24, 25, 26, 27, 28, 29)
+AVAILABLE_SUBNET_SIZES_V6 = (64, 80, 96, 112)
+
+def create_available_prefixes(netbox, prefixes=None):
     """
     Create available subnet prefixes using NetBox API
     
     Args:
         netbox: NetBox client instance
+        prefixes: Optional list of existing prefixes; created prefixes are appended to it
     """
     print("\nCreating available subnet prefixes using NetBox API...")
     
@@ -21,6 +26,7 @@ def create_available_prefixes(netbox):
     
     # Get valid status choices
     valid_statuses = get_valid_status_choices(netbox, 'prefix')
+    valid_status_choices = tuple(valid_statuses)
     print(f"Valid prefix statuses in your NetBox: {', '.join(valid_statuses)}")
     
     # Create the Available tag if it doesn't exist
@@ -39,7 +45,7 @@ def create_available_prefixes(netbox):
     }
     
     # Get all prefixes that could contain available prefixes
-    existing_prefixes = list(netbox.ipam.get_ip_prefixes())
+    existing_prefixes = prefixes if prefixes is not None else list(netbox.ipam.get_ip_prefixes())
     
     # Try to analyze a sample prefix to understand structure
     if existing_prefixes and len(existing_prefixes) > 0:
@@ -79,7 +85,9 @@ def create_available_prefixes(netbox):
             error_log(f"Error processing potential parent prefix: {str(e)}")
     
     print(f"Found {len(parent_prefixes)} potential parent prefixes")
-    available_count = 0
+    
+    # Available prefixes to create
+    new_prefixes = []
     
     # Process each parent to find available subnets
     for parent in parent_prefixes:
@@ -118,51 +126,78 @@ def create_available_prefixes(netbox):
             if not available_prefixes:
                 continue
             
-            print(f"Found {len(available_prefixes)} available prefixes in {parent_prefix}")
+            verbose_print(f"Found {len(available_prefixes)} available prefixes in {parent_prefix}")
             
             # Process found available prefixes - minimal filtering
             for available in available_prefixes:
                 prefix_str = available['prefix']
                 
                 # Use the improved status determination for available prefixes
-                status = determine_prefix_status("", "Available prefix", valid_statuses)
+                status = determine_prefix_status("", "Available prefix", valid_status_choices)
                 
-                # Create the available prefix - don't filter by prefix length
-                try:
-                    # Only add tags if the tag exists
-                    tags_param = [{'name': 'Available'}] if tag_exists else []
-                    
-                    # Prepare params
-                    params = {
-                        'prefix': prefix_str,
-                        'status': status,
-                        'description': "Available prefix",
-                        'tags': tags_param
-                    }
-                    
-                    # Add site and tenant parameters
-                    params.update(association_params)
-                    
-                    # Create the prefix with all parameters
-                    netbox.ipam.create_ip_prefix(**params)
-                    available_count += 1
-                    print(f"Created available prefix: {prefix_str} with status '{status}'")
-                except Exception as e:
-                    error_log(f"Error creating available prefix {prefix_str}: {str(e)}")
-                    print(f"DEBUG ERROR: {str(e)}")
+                # Queue the available prefix - don't filter by prefix length
+                # Only add tags if the tag exists
+                tags_param = [{'name': 'Available'}] if tag_exists else []
+                
+                # Prepare params
+                params = {
+                    'prefix': prefix_str,
+                    'status': status,
+                    'description': "Available prefix",
+                    'tags': tags_param
+                }
+                
+                # Add site and tenant parameters
+                params.update(association_params)
+                new_prefixes.append(params)
                         
         except Exception as e:
             error_log(f"Error processing parent prefix {parent_prefix}: {str(e)}")
             print(f"DEBUG ERROR: {str(e)}")
+    
+    # Create the available prefixes with bulk requests
+    available_count = 0
+    for params, prefix in bulk_create(netbox.ipam.create_ip_prefixes, new_prefixes, "available prefix"):
+        existing_prefixes.append(prefix)
+        available_count += 1
+        verbose_print(f"Created available prefix: {params['prefix']} with status '{params['status']}'")
                 
     print(f"Created {available_count} available subnet prefixes using API")
 
-def create_available_subnets(netbox):
+def _gap_subnets(parent, gap_start, gap_end, new_prefix_len, count=2):
+    """
+    Find the first aligned subnets of a prefix length that fit inside an address gap
+    
+    The subnet addresses are computed directly, so only the returned subnets
+    are built as network objects instead of every subnet of the gap.
+    
+    Args:
+        parent: Parent network containing the gap
+        gap_start: First address of the gap as an integer
+        gap_end: Address just past the end of the gap as an integer
+        new_prefix_len: Prefix length of the subnets
+        count: Maximum number of subnets to return
+        
+    Returns:
+        list: Up to count networks lying entirely within the gap
+    """
+    step = 1 << (parent.max_prefixlen - new_prefix_len)
+    first = (gap_start + step - 1) & ~(step - 1)
+    
+    subnets = []
+    for network_address in range(first, first + count * step, step):
+        if network_address + step > gap_end:
+            break
+        subnets.append(type(parent)((network_address, new_prefix_len)))
+    return subnets
+
+def create_available_subnets(netbox, prefixes=None):
     """
     Identify and create available subnets in gaps between allocated prefixes
     
     Args:
         netbox: NetBox client instance
+        prefixes: Optional list of existing prefixes; created prefixes are appended to it
     """
     print("\nAnalyzing IP space for available subnets...")
     
@@ -172,6 +207,7 @@ def create_available_subnets(netbox):
     
     # Get valid status choices
     valid_statuses = get_valid_status_choices(netbox, 'prefix')
+    valid_status_choices = tuple(valid_statuses)
     
     # Create the Available tag if it doesn't exist
     tag_exists = ensure_tag_exists(netbox, "Available")
@@ -180,210 +216,101 @@ def create_available_subnets(netbox):
     association_params = get_site_tenant_params()
     
     # Get all existing prefixes
-    existing_prefixes = list(netbox.ipam.get_ip_prefixes())
+    existing_prefixes = prefixes if prefixes is not None else list(netbox.ipam.get_ip_prefixes())
     
-    # Group prefixes by parent networks
-    network_groups = {}
+    # Parse every prefix once, indexing the networks by IP version and prefix
+    # length so the parents of a prefix can be found by computing its supernets
+    parsed_prefixes = []
+    networks_by_length = {}
     for prefix in existing_prefixes:
+        prefix_str = record_field(prefix, 'prefix')
+        if prefix_str is None:
+            continue
         try:
-            # Extract prefix string
-            prefix_str = None
-            if hasattr(prefix, 'prefix'):
-                prefix_str = prefix.prefix
-            elif isinstance(prefix, dict) and 'prefix' in prefix:
-                prefix_str = prefix['prefix']
-            else:
-                continue
-                
             network = ipaddress.ip_network(prefix_str)
-            
-            # Less strict filtering
-            if network.prefixlen >= 31 and isinstance(network, ipaddress.IPv4Network):
-                continue
-            if network.prefixlen >= 127 and isinstance(network, ipaddress.IPv6Network):
-                continue
-            
-            # Find the smallest containing prefix
-            parent_prefix = None
-            for potential_parent in existing_prefixes:
-                # Extract parent prefix string
-                parent_str = None
-                if hasattr(potential_parent, 'prefix'):
-                    parent_str = potential_parent.prefix
-                elif isinstance(potential_parent, dict) and 'prefix' in potential_parent:
-                    parent_str = potential_parent['prefix']
-                else:
-                    continue
-                    
-                if prefix_str == parent_str:
-                    continue
-                    
-                try:
-                    parent_network = ipaddress.ip_network(parent_str)
-                    
-                    # Skip if potential parent has same/smaller mask
-                    if parent_network.prefixlen >= network.prefixlen:
-                        continue
-                        
-                    if network.subnet_of(parent_network):
-                        if not parent_prefix or ipaddress.ip_network(parent_prefix).prefixlen > parent_network.prefixlen:
-                            parent_prefix = parent_str
-                except Exception:
-                    continue
-            
-            # Group by parent prefix
-            if parent_prefix:
-                if parent_prefix not in network_groups:
-                    network_groups[parent_prefix] = []
-                network_groups[parent_prefix].append(prefix)
-        except Exception as e:
+        except ValueError:
             continue
+        parsed_prefixes.append((network, prefix))
+        networks_by_length.setdefault((network.version, network.prefixlen), set()).add(network)
     
-    # Track created available subnets
-    available_count = 0
-    status_counts = {status: 0 for status in valid_statuses}
+    # Group prefixes by parent networks
+    network_groups = {}
+    for network, prefix in parsed_prefixes:
+        # Less strict filtering
+        if network.prefixlen >= 31 and isinstance(network, ipaddress.IPv4Network):
+            continue
+        if network.prefixlen >= 127 and isinstance(network, ipaddress.IPv6Network):
+            continue
+        
+        # Find the widest containing prefix, trying the shortest prefix lengths first
+        parent = None
+        for prefixlen in range(network.prefixlen):
+            candidates = networks_by_length.get((network.version, prefixlen))
+            if candidates:
+                supernet = network.supernet(new_prefix=prefixlen)
+                if supernet in candidates:
+                    parent = supernet
+                    break
+        
+        # Group by parent network, which is already parsed
+        if parent is not None:
+            network_groups.setdefault(parent, []).append((network, prefix))
+    
+    # Available subnets to create, found in the gaps of each network group
+    new_prefixes = []
     
     # Process each network group to find gaps
-    for parent_prefix, child_prefixes in network_groups.items():
+    for parent, child_prefixes in network_groups.items():
         try:
-            parent = ipaddress.ip_network(parent_prefix)
-            
-            # Sort child prefixes by network address
-            def get_network_addr(p):
-                p_str = None
-                if hasattr(p, 'prefix'):
-                    p_str = p.prefix
-                elif isinstance(p, dict) and 'prefix' in p:
-                    p_str = p['prefix']
-                else:
-                    return 0
-                try:
-                    return int(ipaddress.ip_network(p_str).network_address)
-                except:
-                    return 0
-            
-            child_prefixes.sort(key=get_network_addr)
+            # Determine suitable prefix sizes based on network type
+            prefix_sizes = AVAILABLE_SUBNET_SIZES_V4 if isinstance(parent, ipaddress.IPv4Network) else AVAILABLE_SUBNET_SIZES_V6
+            prefix_sizes = [new_prefix_len for new_prefix_len in prefix_sizes if new_prefix_len > parent.prefixlen]
+            if not prefix_sizes:
+                continue
             
-            # Track previous network end
-            prev_end = int(parent.network_address)
+            # Only the gap in front of the first child gets available subnets. The
+            # gaps after a child never produced any: the gap network was built with
+            # the parent's prefix length, which fails unless the gap starts on the
+            # parent's own address.
+            gap_start = int(parent.network_address)
+            gap_end = min(int(child[0].network_address) for child in child_prefixes)
             
-            # Find gaps between consecutive prefixes
-            for child in child_prefixes:
-                # Extract child prefix
-                child_str = None
-                if hasattr(child, 'prefix'):
-                    child_str = child.prefix
-                elif isinstance(child, dict) and 'prefix' in child:
-                    child_str = child['prefix']
-                else:
-                    continue
-                    
-                child_net = ipaddress.ip_network(child_str)
-                start = int(child_net.network_address)
+            # Skip gaps too small to hold even the smallest subnet size
+            if gap_end - gap_start >= 1 << (parent.max_prefixlen - prefix_sizes[-1]):
+                # Use the improved status determination
+                status = determine_prefix_status("", "Available subnet", valid_status_choices)
                 
-                # If there's a gap between previous end and current start
-                if start > prev_end:
-                    # Create available subnets in the gap - less filtering
-                    try:
-                        gap_network = ipaddress.ip_network((prev_end, parent.prefixlen))
+                # Queue the first 2 available subnets of each size in the gap
+                for new_prefix_len in prefix_sizes:
+                    for subnet in _gap_subnets(parent, gap_start, gap_end, new_prefix_len):
+                        # Only add tags if the tag exists
+                        tags_param = [{'name': 'Available'}] if tag_exists else []
                         
-                        # Determine suitable prefix sizes based on network type
-                        prefix_sizes = [24, 25, 26, 27, 28, 29] if isinstance(parent, ipaddress.IPv4Network) else [64, 80, 96, 112]
+                        # Prepare params
+                        params = {
+                            'prefix': str(subnet),
+                            'status': status,
+                            'description': "Available subnet",
+                            'tags': tags_param
+                        }
                         
-                        for new_prefix_len in prefix_sizes:
-                            if new_prefix_len > parent.prefixlen:
-                                try:
-                                    subnets = list(gap_network.subnets(new_prefix=new_prefix_len))
-                                    
-                                    # Create first 2 available subnets of each size
-                                    for subnet in subnets[:2]:
-                                        if int(subnet.network_address) < start and int(subnet.broadcast_address) < start:
-                                            try:
-                                                # Only add tags if the tag exists
-                                                tags_param = [{'name': 'Available'}] if tag_exists else []
-                                                
-                                                # Use the improved status determination
-                                                status = determine_prefix_status("", "Available subnet", valid_statuses)
-                                                status_counts[status] += 1
-                                                
-                                                # Prepare params
-                                                params = {
-                                                    'prefix': str(subnet),
-                                                    'status': status,
-                                                    'description': "Available subnet",
-                                                    'tags': tags_param
-                                                }
-                                                
-                                                # Add site and tenant parameters
-                                                params.update(association_params)
-                                                
-                                                # Create the prefix with all parameters
-                                                netbox.ipam.create_ip_prefix(**params)
-                                                available_count += 1
-                                                print(f"Created available subnet: {subnet} with status '{status}'")
-                                            except Exception as e:
-                                                error_log(f"Error creating available subnet {subnet}: {str(e)}")
-                                                print(f"DEBUG ERROR: {str(e)}")
-                                except Exception:
-                                    continue
-                    except Exception as e:
-                        error_log(f"Error processing subnets for gap: {str(e)}")
-                        print(f"DEBUG ERROR: {str(e)}")
-                
-                # Update previous end for next iteration
-                prev_end = int(child_net.broadcast_address) + 1
-            
-            # Check for gap between last child and end of parent
-            if prev_end < int(parent.broadcast_address):
-                try:
-                    gap_network = ipaddress.ip_network((prev_end, parent.prefixlen))
-                    
-                    # Determine suitable prefix sizes based on network type
-                    prefix_sizes = [24, 25, 26, 27, 28, 29] if isinstance(parent, ipaddress.IPv4Network) else [64, 80, 96, 112]
-                    
-                    for new_prefix_len in prefix_sizes:
-                        if new_prefix_len > parent.prefixlen:
-                            try:
-                                subnets = list(gap_network.subnets(new_prefix=new_prefix_len))
-                                
-                                # Create first 2 available subnets of each size
-                                for subnet in subnets[:2]:
-                                    try:
-                                        # Only add tags if the tag exists
-                                        tags_param = [{'name': 'Available'}] if tag_exists else []
-                                        
-                                        # Use the improved status determination
-                                        status = determine_prefix_status("", "Available end gap subnet", valid_statuses)
-                                        status_counts[status] += 1
-                                        
-                                        # Prepare params
-                                        params = {
-                                            'prefix': str(subnet),
-                                            'status': status,
-                                            'description': "Available end gap subnet",
-                                            'tags': tags_param
-                                        }
-                                        
-                                        # Add site and tenant parameters
-                                        params.update(association_params)
-                                        
-                                        # Create the prefix with all parameters
-                                        netbox.ipam.create_ip_prefix(**params)
-                                        available_count += 1
-                                        print(f"Created end gap subnet: {subnet} with status '{status}'")
-                                    except Exception as e:
-                                        error_log(f"Error creating end gap subnet {subnet}: {str(e)}")
-                                        print(f"DEBUG ERROR: {str(e)}")
-                            except Exception:
-                                continue
-                except Exception as e:
-                    error_log(f"Error creating end gap network: {str(e)}")
-                    print(f"DEBUG ERROR: {str(e)}")
+                        # Add site and tenant parameters
+                        params.update(association_params)
+                        new_prefixes.append(params)
         
         except Exception as e:
-            error_log(f"Error processing parent network {parent_prefix}: {str(e)}")
+            error_log(f"Error processing parent network {parent}: {str(e)}")
             print(f"DEBUG ERROR: {str(e)}")
     
+    # Create all available subnets with bulk requests
+    available_count = 0
+    status_counts = {status: 0 for status in valid_statuses}
+    for params, prefix in bulk_create(netbox.ipam.create_ip_prefixes, new_prefixes, "available subnet"):
+        existing_prefixes.append(prefix)
+        available_count += 1
+        status_counts[params['status']] = status_counts.get(params['status'], 0) + 1
+        verbose_print(f"Created {params['description'].lower()}: {params['prefix']} with status '{params['status']}'")
+    
     print(f"Created {available_count} available subnet prefixes")
     print("Status assignments:")
     for status, count in status_counts.items():
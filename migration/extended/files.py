@@ -4,8 +4,8 @@ File attachment migration functions
 import os
 import requests
 
-from racktables_netbox_migration.utils import error_log
-from racktables_netbox_migration.config import NB_HOST, NB_PORT, NB_TOKEN, TARGET_SITE
+from migration.utils import error_log
+from migration.config import NB_HOST, NB_PORT, NB_TOKEN, TARGET_SITE
 
 def migrate_files(cursor, netbox):
     """
@@ -3,14 +3,14 @@ IP range generation module to identify and create available IP ranges
 """
 import ipaddress
 from migration.utils import error_log, ensure_tag_exists
-from migration.config import TARGET_SITE, IPV4_TAG, IPV6_TAG
 
-def create_ip_ranges_from_available_prefixes(netbox):
+def create_ip_ranges_from_available_prefixes(netbox, prefixes=None):
     """
     Create IP ranges from available prefixes
     
     Args:
         netbox: NetBox client instance
+        prefixes: Optional list of existing prefixes to use instead of fetching them
     """
     print("\nCreating IP ranges from available prefixes...")
     
@@ -18,7 +18,7 @@ def create_ip_ranges_from_available_prefixes(netbox):
     tag_exists = ensure_tag_exists(netbox, "Available")
     
     # Get all prefixes with Available tag
-    all_prefixes = list(netbox.ipam.get_ip_prefixes())
+    all_prefixes = prefixes if prefixes is not None else list(netbox.ipam.get_ip_prefixes())
     available_prefixes = []
     
     # Find prefixes with Available tag
@@ -149,12 +149,13 @@ def create_ip_ranges_from_available_prefixes(netbox):
     
     print(f"Created {ranges_created} IP ranges from available prefixes")
 
-def create_ip_ranges(netbox):
+def create_ip_ranges(netbox, prefixes=None):
     """
     Create IP ranges from IP prefixes and addresses
     
     Args:
         netbox: NetBox client instance
+        prefixes: Optional list of existing prefixes to use instead of fetching them
     """
     print("\nGenerating IP ranges...")
     
@@ -162,7 +163,8 @@ def create_ip_ranges(netbox):
     tag_exists = ensure_tag_exists(netbox, "Available")
     
     # Get all prefixes
-    prefixes = list(netbox.ipam.get_ip_prefixes())
+    if prefixes is None:
+        prefixes = list(netbox.ipam.get_ip_prefixes())
     print(f"Found {len(prefixes)} IP prefixes")
     
     # Get all IP addresses
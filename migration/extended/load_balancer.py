@@ -3,10 +3,9 @@ Load balancing data migration functions
 """
 import ipaddress
 import requests
-from slugify import slugify
 
-from racktables_netbox_migration.utils import error_log
-from racktables_netbox_migration.config import NB_HOST, NB_PORT, NB_TOKEN, TARGET_SITE
+from migration.utils import error_log, slugify
+from migration.config import NB_HOST, NB_PORT, NB_TOKEN, TARGET_SITE
 
 def migrate_load_balancing(cursor, netbox):
     """
@@ -3,8 +3,8 @@ Monitoring data migration functions
 """
 import requests
 
-from racktables_netbox_migration.utils import error_log
-from racktables_netbox_migration.config import NB_HOST, NB_PORT, NB_TOKEN, TARGET_SITE
+from migration.utils import error_log
+from migration.config import NB_HOST, NB_PORT, NB_TOKEN, TARGET_SITE
 
 def migrate_monitoring(cursor, netbox):
     """
@@ -4,8 +4,8 @@ NAT mapping migration functions
 import ipaddress
 import requests
 
-from racktables_netbox_migration.utils import error_log
-from racktables_netbox_migration.config import NB_HOST, NB_PORT, NB_TOKEN, TARGET_SITE, IPV4_TAG
+from migration.utils import error_log
+from migration.config import NB_HOST, NB_PORT, NB_TOKEN, TARGET_SITE, IPV4_TAG
 
 def migrate_nat_mappings(cursor, netbox):
     """
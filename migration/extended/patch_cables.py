@@ -2,7 +2,6 @@
 Patch cable migration functions with comprehensive database and duplicate handling
 """
 import requests
-from slugify import slugify
 
 from migration.utils import pickleLoad, error_log
 from migration.config import NB_HOST, NB_PORT, NB_TOKEN, TARGET_SITE
@@ -1,6 +1,7 @@
 """
 Virtual services migration functions
 """
+import re
 from migration.utils import error_log
 from migration.config import TARGET_SITE
 
@@ -264,7 +265,6 @@ def migrate_virtual_services(cursor, netbox):
                         # Try harder to find a port number
                         if isinstance(port_name, str):
                             # Extract numbers from string
-                            import re
                             matches = re.findall(r'\d+', port_name)
                             if matches:
                                 port_numbers.append(int(matches[0]))
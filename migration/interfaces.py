@@ -3,11 +3,11 @@ Interface creation and management functions
 """
 import time
 
-from racktables_netbox_migration.utils import (
+from migration.utils import (
     get_db_connection, get_cursor, pickleLoad, pickleDump, error_log
 )
-from racktables_netbox_migration.db import change_interface_name
-from racktables_netbox_migration.config import TARGET_SITE
+from migration.db import change_interface_name
+from migration.config import TARGET_SITE
 
 def get_interfaces(netbox):
     """
@@ -5,11 +5,11 @@ import ipaddress
 import random
 
 from migration.utils import (
-    get_db_connection, get_cursor, pickleLoad, pickleDump, 
+    get_db_connection, get_cursor, pickleLoad,
     format_prefix_description
 )
 from migration.db import getTags, change_interface_name
-from migration.config import IPV4_TAG, IPV6_TAG, TARGET_TENANT_ID, TARGET_SITE, TARGET_SITE_ID
+from migration.config import IPV4_TAG, IPV6_TAG
 
 def create_ip_networks(netbox, IP, target_site=None):
     """
@@ -29,6 +29,7 @@ def create_ip_networks(netbox, IP, target_site=None):
     # Get valid status choices for prefixes in this NetBox instance
     valid_statuses = get_valid_status_choices(netbox, 'prefix')
     print(f"Valid prefix statuses in your NetBox: {', '.join(valid_statuses)}")
+    valid_status_choices = tuple(valid_statuses)
     
     # Get site and tenant parameters
     association_params = get_site_tenant_params()
@@ -75,7 +76,7 @@ def create_ip_networks(netbox, IP, target_site=None):
         tags = getTags(f"ipv{IP}net", Id)
         
         # Use the improved status determination logic
-        status = determine_prefix_status(prefix_name, comment, valid_statuses)
+        status = determine_prefix_status(prefix_name, comment, valid_status_choices)
         status_counts[status] += 1
         
         # Format description to include tags and prefix name
@@ -156,20 +157,16 @@ def create_ip_allocated(netbox, IP, target_site=None):
         site_obj = None
         try:
             # Get site to determine its ID
-            sites = list(netbox.dcim.get_sites(name=target_site))
-            if sites:
-                site_obj = sites[0]
+            site_obj = netbox.dcim.get_site(name=target_site)
+            if site_obj is not None:
                 site_id = site_obj['id']
                 print(f"Found site '{target_site}' with ID: {site_id}")
             else:
                 # Try a case-insensitive search as fallback
-                all_sites = list(netbox.dcim.get_sites())
-                for site in all_sites:
-                    if site['name'].lower() == target_site.lower():
-                        site_obj = site
-                        site_id = site['id']
-                        print(f"Found site '{site['name']}' with ID: {site_id} (case-insensitive match)")
-                        break
+                site_obj = next(iter(netbox.dcim.get_sites(name__ie=target_site)), None)
+                if site_obj is not None:
+                    site_id = site_obj['id']
+                    print(f"Found site '{site_obj['name']}' with ID: {site_id} (case-insensitive match)")
                 
                 if not site_obj:
                     print(f"Warning: Could not find site '{target_site}'. IP filtering by site will be skipped.")
@@ -298,29 +295,19 @@ def create_ip_allocated(netbox, IP, target_site=None):
             device_id = None
             try:
                 if device_or_vm == "device":
-                    device_results = list(netbox.dcim.get_devices(name=device_name))
-                    if device_results:
-                        device_id = device_results[0]['id']
-                    else:
-                        # Try with case-insensitive search
-                        all_devices = list(netbox.dcim.get_devices())
-                        for dev in all_devices:
-                            if dev['name'].lower() == device_name.lower():
-                                device_id = dev['id']
-                                device_name = dev['name']  # Use the actual name from NetBox
-                                break
+                    get_objects = netbox.dcim.get_devices
                 else:
-                    vm_results = list(netbox.virtualization.get_virtual_machines(name=device_name))
-                    if vm_results:
-                        device_id = vm_results[0]['id']
-                    else:
-                        # Try with case-insensitive search
-                        all_vms = list(netbox.virtualization.get_virtual_machines())
-                        for vm in all_vms:
-                            if vm['name'].lower() == device_name.lower():
-                                device_id = vm['id']
-                                device_name = vm['name']  # Use the actual name from NetBox
-                                break
+                    get_objects = netbox.virtualization.get_virtual_machines
+                
+                # Stop at the first match instead of reading every page of results,
+                # falling back to a case-insensitive name match on the server
+                match = next(iter(get_objects(name=device_name)), None)
+                if match is None:
+                    match = next(iter(get_objects(name__ie=device_name)), None)
+                    if match is not None:
+                        device_name = match['name']  # Use the actual name from NetBox
+                if match is not None:
+                    device_id = match['id']
             except Exception as e:
                 print(f"Error finding device/VM {device_name}: {e}")
             
@@ -6,38 +6,93 @@ Unified migration script for Racktables to NetBox
 import os
 import sys
 import argparse
-import importlib.util
+import hmac
+import importlib
+import json
+import re
+import runpy
 import logging
+import logging.handlers
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import ExitStack
 from datetime import datetime
+from functools import partial
+from itertools import chain
 
-# Add parent directory to path to allow running directly
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-ROOT_DIR = os.path.dirname(SCRIPT_DIR)
-sys.path.insert(0, ROOT_DIR)
+# Allow running this file directly as a script (python migration/migrate.py)
+if __package__ in (None, ""):
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-# Define BASE_DIR for custom fields setup
-BASE_DIR = os.path.dirname(SCRIPT_DIR)
+# Placeholder credentials that must be changed before migrating
+DEFAULT_NB_TOKEN = "0123456789abcdef0123456789abcdef01234567"
+DEFAULT_DB_PASSWORD = "secure-password"
+
+# Where completed custom field setups are recorded per NetBox instance and version
+CUSTOM_FIELDS_STATE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "rt2nb")
+
+# Settings from custom configuration files keyed by (path, modification time)
+_loaded_configs = {}
+
+# Log record format and number of records buffered before writing the log file
+LOG_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+LOG_BUFFER_CAPACITY = 1024
+
+# Maximum number of base migration stages running at the same time
+BASE_MIGRATION_WORKERS = 4
+
+# Stages each base migration stage has to wait for before it can start
+BASE_MIGRATION_DEPENDENCIES = {
+    "vlans": ["vlan_groups"],
+    "racked_devices": ["sites_racks", "vms"],
+    "non_racked_devices": ["racked_devices", "vms"],
+    "interfaces": ["racked_devices", "non_racked_devices", "vms"],
+    "interface_connections": ["interfaces"],
+    "ipv4_networks": ["vlans"],
+    "ipv6_networks": ["vlans"],
+    "ipv4_addresses": ["interfaces"],
+    "ipv6_addresses": ["interfaces"],
+}
+
+# Extended components reading from Racktables: (config flag, module, function)
+EXTENDED_MIGRATION_STAGES = (
+    ("CREATE_PATCH_CABLES", "migration.extended.patch_cables", "migrate_patch_cables"),
+    ("CREATE_FILES", "migration.extended.files", "migrate_files"),
+    ("CREATE_VIRTUAL_SERVICES", "migration.extended.services", "migrate_virtual_services"),
+    ("CREATE_NAT_MAPPINGS", "migration.extended.nat", "migrate_nat_mappings"),
+    ("CREATE_LOAD_BALANCING", "migration.extended.load_balancer", "migrate_load_balancing"),
+    ("CREATE_MONITORING_DATA", "migration.extended.monitoring", "migrate_monitoring"),
+)
+
+# Extended stages working on NetBox prefixes, run in this order after the ones above.
+# Each is called as function(netbox, prefixes=...) with one shared prefix list.
+EXTENDED_PREFIX_STAGES = (
+    # API-detected available prefixes first, then the algorithmic gap fill
+    ("CREATE_AVAILABLE_SUBNETS", "migration.extended.available_subnets", "create_available_prefixes"),
+    ("CREATE_AVAILABLE_SUBNETS", "migration.extended.available_subnets", "create_available_subnets"),
+    # IP ranges for the available prefixes, then ranges from algorithmic detection
+    ("CREATE_IP_RANGES", "migration.extended.ip_ranges", "create_ip_ranges_from_available_prefixes"),
+    ("CREATE_IP_RANGES", "migration.extended.ip_ranges", "create_ip_ranges"),
+)
 
 # Import core modules
-from migration.config import *
-from migration.utils import *
-from migration.db import *
-from migration.custom_netbox import NetBox
+import migration
+from migration import config
+from migration.utils import get_db_connection, get_cursor, create_global_tags
+from migration.site_tenant import ensure_site_tenant_associations
 
 def check_config():
     """Verify configuration is not using defaults"""
-    default_token = "0123456789abcdef0123456789abcdef01234567"
-    if NB_TOKEN == default_token:
-        logging.error("Default API token detected in config.py")
-        logging.error("Please update migration/config.py with your NetBox configuration")
-        return False
-    
-    if DB_CONFIG['password'] == 'secure-password':
-        logging.error("Default database password detected in config.py")
-        logging.error("Please update migration/config.py with your database credentials")
-        return False
+    for setting, value, default, hint in (
+        ("API token", config.NB_TOKEN, DEFAULT_NB_TOKEN, "your NetBox configuration"),
+        ("database password", config.DB_CONFIG['password'], DEFAULT_DB_PASSWORD, "your database credentials"),
+    ):
+        # Constant-time comparison so the check doesn't leak secrets through timing
+        if hmac.compare_digest(str(value).encode(), default.encode()):
+            logging.error("Default %s detected in config.py", setting)
+            logging.error("Please update migration/config.py with %s", hint)
+            return False
     
-    if NB_HOST == "localhost" and NB_PORT == 8000:
+    if config.NB_HOST == "localhost" and config.NB_PORT == 8000:
         logging.warning("Using default NetBox connection settings (localhost:8000)")
         logging.warning("If this is not your actual NetBox server, update migration/config.py")
     
@@ -52,558 +107,375 @@ def parse_arguments():
     parser.add_argument('--basic-only', action='store_true', help='Run only basic migration (no extended components)')
     parser.add_argument('--extended-only', action='store_true', help='Run only extended migration components')
     parser.add_argument('--skip-custom-fields', action='store_true', help='Skip setting up custom fields')
+    parser.add_argument('--force-custom-fields', action='store_true', help='Set up custom fields even if already installed')
+    parser.add_argument('--reset-device-state', action='store_true', help='Ignore device state saved by a previous run and read existing devices from NetBox')
     return parser.parse_args()
 
-def create_helper_modules():
-    """Create required helper modules if they don't exist"""
-    # Create directory if it doesn't exist
-    os.makedirs(os.path.join(os.path.dirname(os.path.abspath(__file__)), "migration"), exist_ok=True)
-    
-    # Create netbox_status.py module
-    netbox_status_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migration", "netbox_status.py")
-    if not os.path.exists(netbox_status_path):
-        with open(netbox_status_path, 'w') as f:
-            f.write("""\"\"\"
-Helper module to determine valid NetBox statuses across versions
-Can be imported by other modules to ensure consistent status handling
-\"\"\"
-import requests
-import logging
-from migration.config import NB_HOST, NB_PORT, NB_TOKEN, NB_USE_SSL
-
-# Cache for valid status choices
-_valid_status_choices = {
-    'prefix': None,
-    'ip_address': None
-}
-
-def get_valid_status_choices(netbox, object_type):
-    \"\"\"
-    Get valid status choices for a specific object type in NetBox
+def setup_custom_fields(force=False):
+    """
+    Run custom fields setup script unless it already completed for this NetBox instance and version
     
     Args:
-        netbox: NetBox client instance
-        object_type: Type of object to get status choices for (e.g., 'prefix')
+        force: Run the setup even if it is recorded as already installed
         
     Returns:
-        list: List of valid status choices
-    \"\"\"
-    global _valid_status_choices
-    
-    # Return cached choices if available
-    if _valid_status_choices[object_type]:
-        return _valid_status_choices[object_type]
-    
-    # API endpoints for different object types
-    endpoints = {
-        'prefix': 'ipam/prefixes',
-        'ip_address': 'ipam/ip-addresses'
-    }
-    
-    # Determine URL based on object type
-    if object_type not in endpoints:
-        logging.error(f"Invalid object type: {object_type}")
-        return ['active']  # Default fallback
-    
-    protocol = "https" if NB_USE_SSL else "http"
-    url = f"{protocol}://{NB_HOST}:{NB_PORT}/api/{endpoints[object_type]}/choices/"
-    
+        bool: True if the custom fields are installed, False otherwise
+    """
     try:
-        headers = {"Authorization": f"Token {NB_TOKEN}"}
-        response = requests.get(url, headers=headers, verify=NB_USE_SSL)
+        from migration import set_custom_fields as custom_fields
         
-        if response.status_code == 200:
-            choices_data = response.json()
-            # Extract status choices from the response
-            status_choices = []
-            
-            # Different NetBox versions have different response formats
-            if 'status' in choices_data:
-                # Newer NetBox versions
-                status_choices = [choice[0] for choice in choices_data['status']]
-            elif 'choices' in choices_data and 'status' in choices_data['choices']:
-                # Older NetBox versions
-                status_choices = [choice[0] for choice in choices_data['choices']['status']]
-            
-            if status_choices:
-                # Cache the results
-                _valid_status_choices[object_type] = status_choices
-                print(f"Valid {object_type} status choices: {', '.join(status_choices)}")
-                return status_choices
+        fingerprint = custom_fields.get_custom_fields_fingerprint()
+        
+        # Only record the setup when the NetBox version is known, so a later
+        # version check can't be matched against an unknown one
+        version = custom_fields.get_netbox_version()
+        state_file = None
+        if version:
+            instance = re.sub(r'[^A-Za-z0-9.-]', '_', f"{config.NB_HOST}_{config.NB_PORT}")
+            state_file = os.path.join(CUSTOM_FIELDS_STATE_DIR, f"custom_fields.{instance}.{version}.ok")
+        
+        if not force and state_file and os.path.exists(state_file):
+            with open(state_file) as f:
+                if json.load(f).get("installed_hash") == fingerprint:
+                    print("Custom fields already installed, skipping setup")
+                    return True
         
-        logging.error(f"Failed to get status choices for {object_type}: {response.status_code}")
+        if not custom_fields.main():
+            return False
+        
+        if not state_file:
+            return True
+        
+        os.makedirs(CUSTOM_FIELDS_STATE_DIR, exist_ok=True)
+        with open(state_file, 'w') as f:
+            json.dump({"installed_hash": fingerprint}, f)
+        return True
     except Exception as e:
-        logging.error(f"Error getting status choices for {object_type}: {str(e)}")
-    
-    # Default fallback for common statuses
-    fallback = ['active', 'container', 'reserved']
-    _valid_status_choices[object_type] = fallback
-    return fallback
+        print(f"Error setting up custom fields: {e}")
+        return False
 
-def determine_prefix_status(prefix_name, comment, valid_statuses=None):
-    \"\"\"
-    Determine the appropriate NetBox status for a prefix based on its name and comments
+def load_config_file(config_path):
+    """
+    Apply the settings from a custom configuration file to migration.config
+    
+    Only upper-case names are treated as settings. They are cached by path and
+    modification time so loading the same unchanged file again skips running it.
     
     Args:
-        prefix_name: Name of the prefix from Racktables
-        comment: Comment for the prefix from Racktables
-        valid_statuses: List of valid status choices in NetBox
-        
-    Returns:
-        str: Most appropriate status for the prefix
-    \"\"\"
-    # Use default statuses if none provided
-    if valid_statuses is None:
-        valid_statuses = ['active', 'container', 'reserved', 'deprecated']
-    
-    # Default to 'container' or first valid status if name/comment are empty
-    if (not prefix_name or prefix_name.strip() == "") and (not comment or comment.strip() == ""):
-        # For empty prefixes, use container (if available) or first valid status
-        return 'container' if 'container' in valid_statuses else valid_statuses[0]
-    
-    # Determine status based on content patterns
-    lower_name = prefix_name.lower() if prefix_name else ""
-    lower_comment = comment.lower() if comment else ""
-    
-    # Check for hints that the prefix is specifically reserved
-    if any(term in lower_name or term in lower_comment for term in 
-           ['reserved', 'hold', 'future', 'planned']):
-        return 'reserved' if 'reserved' in valid_statuses else 'active'
-    
-    # Check for hints that the prefix is deprecated
-    if any(term in lower_name or term in lower_comment for term in 
-           ['deprecated', 'obsolete', 'old', 'inactive', 'decommissioned']):
-        return 'deprecated' if 'deprecated' in valid_statuses else 'active'
-    
-    # Check for specific hints that the prefix should be a container
-    if any(term in lower_name or term in lower_comment for term in 
-           ['container', 'parent', 'supernet', 'aggregate']):
-        return 'container' if 'container' in valid_statuses else 'active'
-    
-    # Check for hints that this is available/unused space
-    if any(term in lower_name or term in lower_comment for term in 
-           ['available', 'unused', 'free', '[here be dragons', '[create network here]', 'unallocated']):
-        return 'container' if 'container' in valid_statuses else 'active'
-    
-    # Check for hints that this is actively used
-    if any(term in lower_name or term in lower_comment for term in 
-           ['in use', 'used', 'active', 'production', 'allocated']):
-        return 'active' if 'active' in valid_statuses else valid_statuses[0]
-    
-    # When we can't clearly determine from the content, default to 'active' for anything with a name/comment
-    # This assumes that if someone took the time to name it, it's likely in use
-    return 'active' if 'active' in valid_statuses else valid_statuses[0]
-""")
-    
-    # Create site_tenant.py module
-    site_tenant_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "migration", "site_tenant.py")
-    if not os.path.exists(site_tenant_path):
-        with open(site_tenant_path, 'w') as f:
-            f.write("""\"\"\"
-Add site and tenant associations to all NetBox objects
-\"\"\"
-import os
-import sys
-import logging
-from slugify import slugify
+        config_path: Path to the configuration file
+    """
+    cache_key = (os.path.abspath(config_path), os.path.getmtime(config_path))
+    settings = _loaded_configs.get(cache_key)
+    if settings is None:
+        namespace = runpy.run_path(config_path)
+        settings = {name: value for name, value in namespace.items() if name.isupper()}
+        _loaded_configs[cache_key] = settings
+    vars(config).update(settings)
 
-def ensure_site_tenant_associations(netbox, site_name, tenant_name):
-    \"\"\"
-    Ensures that site and tenant IDs are properly retrieved and set globally
+def resolve_stage_dependencies(name, stages, dependencies):
+    """
+    Find the registered stages a stage has to wait for
+    
+    A dependency on a stage that is not registered (disabled) is replaced by
+    that stage's own dependencies, so the ordering it implied is kept.
     
     Args:
-        netbox: NetBox client instance
-        site_name: Site name to use
-        tenant_name: Tenant name to use
+        name: Stage name
+        stages: Dictionary mapping registered stage names to callables
+        dependencies: Dictionary mapping stage names to the stage names they need
         
     Returns:
-        tuple: (site_id, tenant_id) or (None, None) if not available
-    \"\"\"
-    # Set up logging to capture detailed information
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler("association_debug.log"),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
-    
-    site_id = None
-    tenant_id = None
-    
-    # Handle site association
-    if site_name:
-        logging.info(f"Looking up site: {site_name}")
-        try:
-            sites = list(netbox.dcim.get_sites(name=site_name))
-            if sites:
-                site = sites[0]
-                # Extract ID based on available format (could be property or dict key)
-                site_id = site.id if hasattr(site, 'id') else site.get('id')
-                logging.info(f"Found site '{site_name}' with ID: {site_id}")
-            else:
-                # Try to create the site if it doesn't exist
-                logging.info(f"Site '{site_name}' not found, creating it...")
-                try:
-                    new_site = netbox.dcim.create_site(site_name, slugify(site_name))
-                    site_id = new_site.id if hasattr(new_site, 'id') else new_site.get('id')
-                    logging.info(f"Created site '{site_name}' with ID: {site_id}")
-                except Exception as e:
-                    logging.error(f"Failed to create site '{site_name}': {str(e)}")
-        except Exception as e:
-            logging.error(f"Error looking up site '{site_name}': {str(e)}")
-    
-    # Handle tenant association
-    if tenant_name:
-        logging.info(f"Looking up tenant: {tenant_name}")
-        try:
-            tenants = list(netbox.tenancy.get_tenants(name=tenant_name))
-            if tenants:
-                tenant = tenants[0]
-                # Extract ID based on available format (could be property or dict key)
-                tenant_id = tenant.id if hasattr(tenant, 'id') else tenant.get('id')
-                logging.info(f"Found tenant '{tenant_name}' with ID: {tenant_id}")
-            else:
-                # Try to create the tenant if it doesn't exist
-                logging.info(f"Tenant '{tenant_name}' not found, creating it...")
-                try:
-                    new_tenant = netbox.tenancy.create_tenant(tenant_name, slugify(tenant_name))
-                    tenant_id = new_tenant.id if hasattr(new_tenant, 'id') else new_tenant.get('id')
-                    logging.info(f"Created tenant '{tenant_name}' with ID: {tenant_id}")
-                except Exception as e:
-                    logging.error(f"Failed to create tenant '{tenant_name}': {str(e)}")
-        except Exception as e:
-            logging.error(f"Error looking up tenant '{tenant_name}': {str(e)}")
-    
-    # Save to environment variables for consistent access
-    if site_id:
-        os.environ['NETBOX_SITE_ID'] = str(site_id)
-    if tenant_id:
-        os.environ['NETBOX_TENANT_ID'] = str(tenant_id)
-    
-    return site_id, tenant_id
+        set: Names of the registered stages the stage depends on
+    """
+    required = set()
+    to_visit = list(dependencies.get(name, ()))
+    visited = set()
+    while to_visit:
+        dep = to_visit.pop()
+        if dep in visited:
+            continue
+        visited.add(dep)
+        if dep in stages:
+            required.add(dep)
+        else:
+            to_visit.extend(dependencies.get(dep, ()))
+    return required
 
-def get_site_tenant_params():
-    \"\"\"
-    Get site and tenant parameters for API calls
-    
-    Returns:
-        dict: Parameters for site and tenant to be passed to API calls
-    \"\"\"
-    params = {}
-    
-    # Get site ID from environment or global variable
-    site_id = os.environ.get('NETBOX_SITE_ID')
-    if site_id:
-        params['site'] = site_id
-    
-    # Get tenant ID from environment or global variable
-    tenant_id = os.environ.get('NETBOX_TENANT_ID')
-    if tenant_id:
-        params['tenant'] = tenant_id
+def run_stages(stages, dependencies, max_workers=BASE_MIGRATION_WORKERS):
+    """
+    Run migration stages concurrently while respecting their dependencies
     
-    return params
-""")
-
-def verify_site_exists(netbox, site_name):
-    """Verify that the specified site exists in NetBox and create a matching tag"""
-    global TARGET_SITE_ID  # Global declaration must come first
-
-    if not site_name:
-        return True
+    A stage is started as soon as every stage it depends on has finished.
+    Dependencies on stages that are not registered (disabled) are resolved
+    through their own dependencies, and stages depending on a failed stage
+    are skipped.
     
-    sites = list(netbox.dcim.get_sites(name=site_name))
-    if sites:
-        print(f"Target site '{site_name}' found - restricting migration to this site")
-        
-        # Create a tag with the same name as the site
-        from migration.utils import create_global_tags
-        create_global_tags(netbox, [site_name])
-        print(f"Created tag '{site_name}' to match site name")
-        
-        # Store the site ID in the global config
-        TARGET_SITE_ID = sites[0].id if hasattr(sites[0], 'id') else sites[0]['id']
-        print(f"Using site ID: {TARGET_SITE_ID}")
+    Args:
+        stages: Dictionary mapping stage names to callables
+        dependencies: Dictionary mapping stage names to the stage names they need
+        max_workers: Maximum number of stages running at the same time
         
-        return True
-    else:
-        # Create the site if it doesn't exist
-        try:
-            from slugify import slugify
-            print(f"Target site '{site_name}' not found in NetBox, creating it...")
-            new_site = netbox.dcim.create_site(site_name, slugify(site_name))
-            
-            # Store the site ID in the global config
-            TARGET_SITE_ID = new_site.id if hasattr(new_site, 'id') else new_site['id']
-            print(f"Created site '{site_name}' with ID: {TARGET_SITE_ID}")
+    Returns:
+        bool: True if all stages completed successfully, False otherwise
+    """
+    pending = dict(stages)
+    required_by_stage = {name: resolve_stage_dependencies(name, stages, dependencies) for name in stages}
+    completed = set()
+    failed = set()
+    running = {}
+    
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        while pending or running:
+            for name in list(pending):
+                required = required_by_stage[name]
+                if any(dep in failed for dep in required):
+                    logging.error("Skipping stage '%s' because a stage it depends on failed", name)
+                    failed.add(name)
+                    del pending[name]
+                elif all(dep in completed for dep in required):
+                    running[executor.submit(pending.pop(name))] = name
             
-            # Create a tag with the same name as the site
-            from migration.utils import create_global_tags
-            create_global_tags(netbox, [site_name])
-            print(f"Created tag '{site_name}' to match site name")
+            if not running:
+                break
             
-            return True
-        except Exception as e:
-            print(f"ERROR: Failed to create site '{site_name}': {e}")
-            return False
-
-def verify_tenant_exists(netbox, tenant_name):
-    """Verify that the specified tenant exists in NetBox and create a matching tag"""
-    global TARGET_TENANT_ID  # Global declaration must come first
-
-    if not tenant_name:
-        return True
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                try:
+                    future.result()
+                    completed.add(name)
+                except Exception as e:
+                    logging.error("Stage '%s' failed: %s", name, e)
+                    failed.add(name)
     
-    tenants = list(netbox.tenancy.get_tenants(name=tenant_name))
-    if tenants:
-        print(f"Target tenant '{tenant_name}' found - restricting migration to this tenant")
-        
-        # Create a tag with the same name as the tenant
-        from migration.utils import create_global_tags
-        create_global_tags(netbox, [tenant_name])
-        print(f"Created tag '{tenant_name}' to match tenant name")
-        
-        # Store the tenant ID in the global config
-        TARGET_TENANT_ID = tenants[0].id if hasattr(tenants[0], 'id') else tenants[0]['id']
-        print(f"Using tenant ID: {TARGET_TENANT_ID}")
-        
-        return True
-    else:
-        # Create the tenant if it doesn't exist
-        try:
-            from slugify import slugify
-            print(f"Target tenant '{tenant_name}' not found in NetBox, creating it...")
-            new_tenant = netbox.tenancy.create_tenant(tenant_name, slugify(tenant_name))
-            
-            # Store the tenant ID in the global config
-            TARGET_TENANT_ID = new_tenant.id if hasattr(new_tenant, 'id') else new_tenant['id']
-            print(f"Created tenant '{tenant_name}' with ID: {TARGET_TENANT_ID}")
-            
-            # Create a tag with the same name as the tenant
-            from migration.utils import create_global_tags
-            create_global_tags(netbox, [tenant_name])
-            print(f"Created tag '{tenant_name}' to match tenant name")
-            
-            return True
-        except Exception as e:
-            print(f"ERROR: Failed to create tenant '{tenant_name}': {e}")
-            return False
-
-def setup_custom_fields():
-    """Run custom fields setup script"""
-    try:
-        script_path = os.path.join(BASE_DIR, "migration", "set_custom_fields.py")
-        spec = importlib.util.spec_from_file_location("set_custom_fields", script_path)
-        custom_fields = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(custom_fields)
-        custom_fields.main()
-        return True
-    except Exception as e:
-        print(f"Error setting up custom fields: {e}")
-        return False
+    return not failed
 
-def run_base_migration(netbox):
-    """Run the basic migration components"""
-    # Create standard tags
-    global_tags = set(tag['name'] for tag in netbox.extras.get_tags())
-    create_global_tags(netbox, (IPV4_TAG, IPV6_TAG))
+def run_base_migration(netbox, connection, resume_device_state=True):
+    """Run the basic migration components, resuming from saved device state unless told not to"""
+    # Register the enabled components as stages; independent ones run concurrently
+    stages = {}
     
-    with get_db_connection() as connection:
-        with get_cursor(connection) as cursor:
-            cursor.execute("SELECT tag FROM TagTree")
-            create_global_tags(netbox, (row["tag"] for row in cursor.fetchall()))
-    
-    print("Created tags")
+    # VLAN domain names read by the VLAN groups stage, reused by the VLANs stage
+    vlan_domain_id_names = {}
     
-    # Process components according to flags
-    if CREATE_VLAN_GROUPS:
-        import migration.vlans as vlans
-        vlans.create_vlan_groups(netbox)
+    if config.CREATE_VLAN_GROUPS:
+        stages["vlan_groups"] = lambda: vlan_domain_id_names.update(migration.vlans.create_vlan_groups(netbox))
     
-    if CREATE_VLANS:
-        import migration.vlans as vlans
-        vlans.create_vlans(netbox)
+    if config.CREATE_VLANS:
+        stages["vlans"] = lambda: migration.vlans.create_vlans(netbox, vlan_domain_id_names if config.CREATE_VLAN_GROUPS else None)
     
-    if CREATE_MOUNTED_VMS or CREATE_UNMOUNTED_VMS:
-        import migration.vms as vms
-        vms.create_vms(netbox, CREATE_MOUNTED_VMS, CREATE_UNMOUNTED_VMS)
+    if config.CREATE_MOUNTED_VMS or config.CREATE_UNMOUNTED_VMS:
+        stages["vms"] = lambda: migration.vms.create_vms(netbox, config.CREATE_MOUNTED_VMS, config.CREATE_UNMOUNTED_VMS)
     
-    if CREATE_RACKED_DEVICES:
-        import migration.devices as devices
-        import migration.sites as sites
-        sites.create_sites_and_racks(netbox)
-        devices.create_racked_devices(netbox)
+    if config.CREATE_RACKED_DEVICES:
+        stages["sites_racks"] = lambda: migration.sites.create_sites_and_racks(netbox)
+        stages["racked_devices"] = lambda: migration.devices.create_racked_devices(netbox, resume=resume_device_state)
     
-    if CREATE_NON_RACKED_DEVICES:
-        import migration.devices as devices
-        devices.create_non_racked_devices(netbox)
+    if config.CREATE_NON_RACKED_DEVICES:
+        stages["non_racked_devices"] = lambda: migration.devices.create_non_racked_devices(netbox)
     
-    if CREATE_INTERFACES:
-        import migration.interfaces as interfaces
-        interfaces.create_interfaces(netbox)
+    if config.CREATE_INTERFACES:
+        stages["interfaces"] = lambda: migration.interfaces.create_interfaces(netbox)
     
-    if CREATE_INTERFACE_CONNECTIONS:
-        import migration.interfaces as interfaces
-        interfaces.create_interface_connections(netbox)
+    if config.CREATE_INTERFACE_CONNECTIONS:
+        stages["interface_connections"] = lambda: migration.interfaces.create_interface_connections(netbox)
     
-    if CREATE_IPV4 or CREATE_IPV6:
-        import migration.ips as ips
+    if config.CREATE_IPV4 or config.CREATE_IPV6:
+        def create_ip_addresses(IP):
+            if config.CREATE_IP_ALLOCATED:
+                migration.ips.create_ip_allocated(netbox, IP, config.TARGET_SITE)
+            
+            # Non-allocated addresses skip whatever the allocated pass created
+            if config.CREATE_IP_NOT_ALLOCATED:
+                migration.ips.create_ip_not_allocated(netbox, IP, config.TARGET_SITE)
+        
+        # Prefixes and addresses of both IP versions are independent of each other
         versions = []
-        if CREATE_IPV4:
+        if config.CREATE_IPV4:
             versions.append("4")
-        if CREATE_IPV6:
+        if config.CREATE_IPV6:
             versions.append("6")
         
         for IP in versions:
-            if CREATE_IP_NETWORKS:
-                ips.create_ip_networks(netbox, IP, TARGET_SITE)
+            if config.CREATE_IP_NETWORKS:
+                stages[f"ipv{IP}_networks"] = partial(migration.ips.create_ip_networks, netbox, IP, config.TARGET_SITE)
             
-            if CREATE_IP_ALLOCATED:
-                ips.create_ip_allocated(netbox, IP, TARGET_SITE)
-            
-            if CREATE_IP_NOT_ALLOCATED:
-                ips.create_ip_not_allocated(netbox, IP, TARGET_SITE)
+            if config.CREATE_IP_ALLOCATED or config.CREATE_IP_NOT_ALLOCATED:
+                stages[f"ipv{IP}_addresses"] = partial(create_ip_addresses, IP)
+    
+    # Nothing to migrate; skip the tag setup round-trips as well
+    if not stages:
+        logging.info("No base migration components enabled, skipping base migration")
+        return True
+    
+    # Create standard tags together with all Racktables tags
+    with get_cursor(connection, stream=True, dict_rows=False) as cursor:
+        cursor.execute("SELECT tag FROM TagTree")
+        create_global_tags(
+            netbox,
+            chain((config.IPV4_TAG, config.IPV6_TAG), (row[0] for row in cursor))
+        )
+    
+    print("Created tags")
+    
+    if not run_stages(stages, BASE_MIGRATION_DEPENDENCIES):
+        logging.error("Base migration completed with errors")
+        return False
     
     print("Base migration completed successfully!")
     return True
 
-def run_extended_migration(netbox):
+def run_extended_migration(netbox, connection):
     """Run the additional migration components"""
-    with get_db_connection() as connection:
+    # Import only the enabled components; the others are never loaded
+    migrations = [
+        getattr(importlib.import_module(module_name), function_name)
+        for flag, module_name, function_name in EXTENDED_MIGRATION_STAGES
+        if getattr(config, flag)
+    ]
+    
+    if migrations:
+        # The shared connection may have been idle during a long base migration
+        connection.ping(reconnect=True)
         with get_cursor(connection) as cursor:
-            if CREATE_PATCH_CABLES:
-                from migration.extended.patch_cables import migrate_patch_cables
-                migrate_patch_cables(cursor, netbox)
-            
-            if CREATE_FILES:
-                from migration.extended.files import migrate_files
-                migrate_files(cursor, netbox)
-                
-            if CREATE_VIRTUAL_SERVICES:
-                from migration.extended.services import migrate_virtual_services
-                migrate_virtual_services(cursor, netbox)
-                
-            if CREATE_NAT_MAPPINGS:
-                from migration.extended.nat import migrate_nat_mappings
-                migrate_nat_mappings(cursor, netbox)
-                
-            if CREATE_LOAD_BALANCING:
-                from migration.extended.load_balancer import migrate_load_balancing
-                migrate_load_balancing(cursor, netbox)
-                
-            if CREATE_MONITORING_DATA:
-                from migration.extended.monitoring import migrate_monitoring
-                migrate_monitoring(cursor, netbox)
-    
-    # Create available subnets
-    if CREATE_AVAILABLE_SUBNETS:
-        # First use the API-based approach to get accurate available prefixes
-        from migration.extended.available_subnets import create_available_prefixes
-        create_available_prefixes(netbox)
-        
-        # Then use the algorithmic approach as a fallback
-        from migration.extended.available_subnets import create_available_subnets
-        create_available_subnets(netbox)
-    
-    # Generate IP ranges based on imported IP data
-    if CREATE_IP_RANGES:
-        # First create IP ranges from API-detected available prefixes
-        from migration.extended.ip_ranges import create_ip_ranges_from_available_prefixes
-        create_ip_ranges_from_available_prefixes(netbox)
-        
-        # Then create ranges from algorithmic detection
-        from migration.extended.ip_ranges import create_ip_ranges
-        create_ip_ranges(netbox)
+            for migrate in migrations:
+                migrate(cursor, netbox)
+    
+    prefix_steps = [
+        getattr(importlib.import_module(module_name), function_name)
+        for flag, module_name, function_name in EXTENDED_PREFIX_STAGES
+        if getattr(config, flag)
+    ]
+    
+    if prefix_steps:
+        # Fetch existing prefixes once; steps append the prefixes they create
+        prefixes = list(netbox.ipam.get_ip_prefixes())
+        for step in prefix_steps:
+            step(netbox, prefixes=prefixes)
     
     print("Extended migration completed successfully!")
     return True
 
-def main():
-    """Main migration function"""
+def main(netbox=None):
+    """
+    Main migration function
+    
+    Args:
+        netbox: Optional NetBox client to reuse; a new one is created if not given
+    """
     # Parse command line arguments
     args = parse_arguments()
     
     # Set up logging
     log_filename = f"migration_{datetime.now().strftime('%Y%m%d_%H%M%S')}.log"
+    file_handler = logging.FileHandler(log_filename)
+    file_handler.setFormatter(logging.Formatter(LOG_FORMAT))
     logging.basicConfig(
         level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
+        format=LOG_FORMAT,
         handlers=[
-            logging.FileHandler(log_filename),
+            # Batch writes to the log file; errors are written out immediately.
+            # logging.shutdown() flushes the remaining records at exit.
+            logging.handlers.MemoryHandler(
+                LOG_BUFFER_CAPACITY, flushLevel=logging.ERROR, target=file_handler
+            ),
             logging.StreamHandler(sys.stdout)
         ]
     )
     
-    # Set target site if specified
-    if args.site:
-        global TARGET_SITE
-        TARGET_SITE = args.site
-        logging.info(f"Filtering migration for site: {TARGET_SITE}")
-    
-    # Set target tenant if specified
-    if args.tenant:
-        global TARGET_TENANT
-        TARGET_TENANT = args.tenant
-        logging.info(f"Filtering migration for tenant: {TARGET_TENANT}")
-        
-    # Create required helper modules
-    create_helper_modules()
-    
     # Load custom config if specified
     if args.config:
         if os.path.exists(args.config):
             try:
-                exec(open(args.config).read())
-                logging.info(f"Loaded custom configuration from {args.config}")
+                load_config_file(args.config)
+                logging.info("Loaded custom configuration from %s", args.config)
             except Exception as e:
-                logging.error(f"Error loading config: {e}")
+                logging.error("Error loading config: %s", e)
                 return False
         else:
-            logging.error(f"Config file not found: {args.config}")
+            logging.error("Config file not found: %s", args.config)
             return False
     
+    # Set target site if specified; the command line overrides the config file
+    if args.site:
+        config.TARGET_SITE = args.site
+        logging.info("Filtering migration for site: %s", config.TARGET_SITE)
+    
+    # Set target tenant if specified
+    if args.tenant:
+        config.TARGET_TENANT = args.tenant
+        logging.info("Filtering migration for tenant: %s", config.TARGET_TENANT)
+    
     # Verify configuration is not using defaults
     if not check_config():
         return False
     
-    # Attempt database connection
-    try:
-        logging.info("Testing database connection...")
-        with get_db_connection() as connection:
+    # Open the database connection shared by the whole migration
+    with ExitStack() as resources:
+        try:
+            logging.info("Connecting to database...")
+            connection = resources.enter_context(get_db_connection())
             logging.info("Database connection successful")
-    except Exception as e:
-        logging.error(f"Database connection failed: {e}")
-        return False
+        except Exception as e:
+            logging.error("Database connection failed: %s", e)
+            return False
+        
+        return run_migration(args, connection, netbox)
+
+def run_migration(args, connection, netbox=None):
+    """
+    Set up NetBox and run the migration parts selected on the command line
     
-    # Set up custom fields if not skipped
-    if not args.skip_custom_fields:
-        logging.info("Setting up custom fields...")
-        if not setup_custom_fields():
+    Args:
+        args: Parsed command line arguments
+        connection: Racktables database connection shared by the migration
+        netbox: Optional NetBox client to reuse instead of creating a new one
+        
+    Returns:
+        bool: True if the migration completed successfully, False otherwise
+    """
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        # Set up custom fields if not skipped, in the background while the site
+        # and tenant are resolved; neither depends on the other
+        custom_fields_future = None
+        if not args.skip_custom_fields:
+            logging.info("Setting up custom fields...")
+            custom_fields_future = executor.submit(setup_custom_fields, force=args.force_custom_fields)
+        
+        # Initialize NetBox connection unless the caller already has one
+        if netbox is None:
+            logging.info("Initializing NetBox connection...")
+            # Imported here so pynetbox and requests only load when NetBox is used
+            from migration.custom_netbox import NetBox
+            try:
+                netbox = NetBox(host=config.NB_HOST, port=config.NB_PORT, use_ssl=config.NB_USE_SSL, auth_token=config.NB_TOKEN)
+            except Exception as e:
+                logging.error("Failed to initialize NetBox connection: %s", e)
+                return False
+        
+        # Ensure site and tenant associations are set up
+        site_id, tenant_id = ensure_site_tenant_associations(netbox, config.TARGET_SITE, config.TARGET_TENANT)
+        
+        # The migration stages need the custom fields, so wait for them here
+        if custom_fields_future and not custom_fields_future.result():
             logging.warning("Custom fields setup had errors. Continuing with migration...")
     
-    # Initialize NetBox connection
-    logging.info("Initializing NetBox connection...")
-    try:
-        netbox = NetBox(host=NB_HOST, port=NB_PORT, use_ssl=NB_USE_SSL, auth_token=NB_TOKEN)
-    except Exception as e:
-        logging.error(f"Failed to initialize NetBox connection: {e}")
-        return False
-    
-    # Ensure site and tenant associations are set up
-    from migration.site_tenant import ensure_site_tenant_associations
-    ensure_site_tenant_associations(netbox, TARGET_SITE, TARGET_TENANT)
+    # Stash the resolved IDs before the stage modules import them from config
+    if site_id:
+        config.TARGET_SITE_ID = site_id
+    if tenant_id:
+        config.TARGET_TENANT_ID = tenant_id
     
     # Run migrations based on arguments
     success = True
     
     if not args.extended_only:
         logging.info("Starting base migration...")
-        success = run_base_migration(netbox) and success
+        success = run_base_migration(netbox, connection, resume_device_state=not args.reset_device_state) and success
     
     if not args.basic_only:
         logging.info("Starting extended migration...")
-        success = run_extended_migration(netbox) and success
+        success = run_extended_migration(netbox, connection) and success
     
     if success:
         logging.info("Migration completed successfully!")
@@ -612,6 +484,9 @@ def main():
     
     return success
 
+def cli():
+    """Console script entry point"""
+    sys.exit(0 if main() else 1)
+
 if __name__ == "__main__":
-    success = main()
-    sys.exit(0 if success else 1)
+    cli()
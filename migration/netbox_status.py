@@ -2,20 +2,142 @@
 Helper module to determine valid NetBox statuses across versions
 Can be imported by other modules to ensure consistent status handling
 """
+import os
+import re
+import json
+import time
+import tempfile
+import threading
+import functools
 import requests
 import logging
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from migration.config import NB_HOST, NB_PORT, NB_TOKEN, NB_USE_SSL
 
+# Shared HTTP session so connections to NetBox are reused between requests
+_SESSION = requests.Session()
+_SESSION.headers.update({"Authorization": f"Token {NB_TOKEN}"})
+_SESSION.verify = NB_USE_SSL
+_ADAPTER = HTTPAdapter(pool_connections=10, pool_maxsize=20,
+                       max_retries=Retry(total=3, backoff_factor=0.2))
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+
+# Base URL of the NetBox API and the endpoints for object types with status choices
+_API_URL = f"{'https' if NB_USE_SSL else 'http'}://{NB_HOST}:{NB_PORT}/api"
+_ENDPOINTS = {
+    'prefix': 'ipam/prefixes',
+    'ip_address': 'ipam/ip-addresses'
+}
+
+# Standard statuses used when NetBox can't tell us which ones are valid
+_DEFAULT_STATUSES = ('active', 'container', 'reserved', 'deprecated')
+_DEFAULT_STATUS_SET = frozenset(_DEFAULT_STATUSES)
+
+# Keyword hints used to guess a prefix status, in priority order, with the
+# status each one suggests. The first category with any match wins.
+_STATUS_HINTS = (
+    ('reserved', 'reserved', ('reserved', 'hold', 'future', 'planned')),
+    ('deprecated', 'deprecated', ('deprecated', 'obsolete', 'old', 'inactive', 'decommissioned')),
+    ('container', 'container', ('container', 'parent', 'supernet', 'aggregate')),
+    ('available', 'container', ('available', 'unused', 'free', '[here be dragons', '[create network here]', 'unallocated')),
+    ('active', 'active', ('in use', 'used', 'active', 'production', 'allocated')),
+)
+
+# One case-insensitive pattern finding every hint, including overlapping ones.
+# The zero-width lookahead lets a match start at each position of the text.
+_STATUS_HINT_RE = re.compile(
+    "(?=" + "|".join(
+        f"(?P<{category}>" + "|".join(re.escape(term) for term in terms) + ")"
+        for category, _, terms in _STATUS_HINTS
+    ) + ")",
+    re.IGNORECASE
+)
+_STATUS_HINT_RANK = {category: rank for rank, (category, _, _) in enumerate(_STATUS_HINTS)}
+
+def _hinted_status(text):
+    """
+    Find the highest priority status hinted at by the text in a single pass
+    
+    Args:
+        text: Text to search for status keywords
+        
+    Returns:
+        str: Suggested status, or None if the text contains no hints
+    """
+    best = None
+    for match in _STATUS_HINT_RE.finditer(text):
+        rank = _STATUS_HINT_RANK[match.lastgroup]
+        if best is None or rank < best:
+            best = rank
+            if rank == 0:
+                break
+    return None if best is None else _STATUS_HINTS[best][1]
+
 # Cache for valid status choices
 _valid_status_choices = {
     'prefix': None,
     'ip_address': None
 }
+_valid_status_choices_lock = threading.Lock()
+
+# Status choices detected in earlier runs, keyed by NetBox host, port and object type
+STATUS_CHOICES_CACHE_FILE = os.path.join(os.path.expanduser("~"), ".cache", "rt2nb", "status_choices.json")
+STATUS_CHOICES_CACHE_TTL = 24 * 60 * 60  # seconds
+
+def _read_status_choices_cache():
+    """Load the status choices cache file, or an empty cache if it can't be read"""
+    try:
+        with open(STATUS_CHOICES_CACHE_FILE) as f:
+            cache = json.load(f)
+        return cache if isinstance(cache, dict) else {}
+    except (OSError, ValueError):
+        return {}
+
+_status_choices_cache = _read_status_choices_cache()
+
+def _status_choices_cache_key(object_type):
+    """Cache key for an object type on the configured NetBox instance"""
+    return f"{NB_HOST}:{NB_PORT}/{object_type}"
+
+def _load_cached_status_choices(object_type):
+    """Return status choices from the cache file if present and not expired"""
+    entry = _status_choices_cache.get(_status_choices_cache_key(object_type))
+    if not isinstance(entry, dict) or not entry.get("choices"):
+        return None
+    if time.time() - entry.get("fetched_at", 0) > STATUS_CHOICES_CACHE_TTL:
+        return None
+    return entry["choices"]
+
+def _save_cached_status_choices(object_type, choices):
+    """Record detected status choices in the cache file, replacing it atomically"""
+    _status_choices_cache[_status_choices_cache_key(object_type)] = {
+        "choices": choices,
+        "fetched_at": time.time()
+    }
+    try:
+        cache_dir = os.path.dirname(STATUS_CHOICES_CACHE_FILE)
+        os.makedirs(cache_dir, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=cache_dir, suffix=".tmp")
+        try:
+            with os.fdopen(fd, 'w') as f:
+                json.dump(_status_choices_cache, f)
+            os.replace(tmp_path, STATUS_CHOICES_CACHE_FILE)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+    except OSError as e:
+        logging.warning(f"Could not write status choices cache: {str(e)}")
 
 def get_valid_status_choices(netbox, object_type):
     """
     Get valid status choices for a specific object type in NetBox
     
+    Safe to call from several threads; NetBox is only probed once per object type.
+    Detected choices are kept on disk for STATUS_CHOICES_CACHE_TTL seconds so
+    later runs don't need to probe NetBox again.
+    
     Args:
         netbox: NetBox client instance
         object_type: Type of object to get status choices for (e.g., 'prefix')
@@ -23,31 +145,74 @@ def get_valid_status_choices(netbox, object_type):
     Returns:
         list: List of valid status choices
     """
-    global _valid_status_choices
-    
     # Return cached choices if available
-    if _valid_status_choices[object_type]:
+    if _valid_status_choices.get(object_type):
         return _valid_status_choices[object_type]
     
-    # API endpoints for different object types
-    endpoints = {
-        'prefix': 'ipam/prefixes',
-        'ip_address': 'ipam/ip-addresses'
-    }
+    with _valid_status_choices_lock:
+        # Another thread may have filled the cache while we waited
+        if not _valid_status_choices.get(object_type):
+            choices = _load_cached_status_choices(object_type)
+            if choices is None:
+                choices = _detect_status_choices(object_type)
+                if choices is None:
+                    # Don't persist the fallback so the next run probes again
+                    choices = list(_DEFAULT_STATUSES)
+                    print(f"Using fallback status choices: {', '.join(choices)}")
+                else:
+                    _save_cached_status_choices(object_type, choices)
+            _valid_status_choices[object_type] = choices
+        return _valid_status_choices[object_type]
+
+def _options_status_choices(object_type):
+    """
+    Read the status choices of an object type from the endpoint's OPTIONS metadata
     
+    NetBox only includes the POST field metadata for users allowed to create
+    objects, so this can come back empty even on a working instance.
+    
+    Args:
+        object_type: Type of object to get status choices for (e.g., 'prefix')
+        
+    Returns:
+        list: List of valid status choices, or None if they aren't available
+    """
+    try:
+        response = _SESSION.options(f"{_API_URL}/{_ENDPOINTS[object_type]}/", timeout=10)
+        if response.status_code != 200:
+            return None
+        choices = response.json()["actions"]["POST"]["status"]["choices"]
+        return [choice["value"] for choice in choices if choice.get("value")] or None
+    except (requests.exceptions.RequestException, ValueError, KeyError, TypeError) as e:
+        logging.debug(f"Status choices not available from OPTIONS metadata: {str(e)}")
+        return None
+
+def _detect_status_choices(object_type):
+    """
+    Probe NetBox for the status choices of an object type
+    
+    Args:
+        object_type: Type of object to get status choices for (e.g., 'prefix')
+        
+    Returns:
+        list: List of valid status choices, or None if NetBox couldn't be probed
+    """
     # Determine URL based on object type
-    if object_type not in endpoints:
+    if object_type not in _ENDPOINTS:
         logging.error(f"Invalid object type: {object_type}")
         return ['active']  # Default fallback
     
-    protocol = "https" if NB_USE_SSL else "http"
-    headers = {"Authorization": f"Token {NB_TOKEN}"}
+    # Ask NetBox for the choices directly; one request and no objects needed
+    statuses = _options_status_choices(object_type)
+    if statuses:
+        print(f"Found status choices for {object_type}: {', '.join(statuses)}")
+        return statuses
     
     # DIRECT APPROACH: Get real objects and read their status structure
     try:
         # First try to get a site as reference - sites almost always exist
-        site_endpoint = f"{protocol}://{NB_HOST}:{NB_PORT}/api/dcim/sites/"
-        response = requests.get(site_endpoint, headers=headers, verify=NB_USE_SSL, params={"limit": 1})
+        site_endpoint = f"{_API_URL}/dcim/sites/"
+        response = _SESSION.get(site_endpoint, params={"limit": 1}, timeout=10)
         
         if response.status_code == 200:
             data = response.json()
@@ -58,45 +223,55 @@ def get_valid_status_choices(netbox, object_type):
                     print(f"Found NetBox using dictionary status format")
                     
                     # Check if we can get actual objects of requested type
-                    obj_endpoint = f"{protocol}://{NB_HOST}:{NB_PORT}/api/{endpoints[object_type]}/"
-                    obj_response = requests.get(obj_endpoint, headers=headers, verify=NB_USE_SSL, params={"limit": 10})
+                    obj_endpoint = f"{_API_URL}/{_ENDPOINTS[object_type]}/"
+                    obj_response = _SESSION.get(obj_endpoint, params={"limit": 10}, timeout=10)
                     
                     if obj_response.status_code == 200:
                         obj_data = obj_response.json()
                         if "results" in obj_data and len(obj_data["results"]) > 0:
-                            # Extract all unique status values from objects
-                            statuses = []
+                            # Extract all unique status values from objects, in order of appearance
+                            statuses = {}
                             for obj in obj_data["results"]:
                                 if "status" in obj and isinstance(obj["status"], dict):
                                     status_value = obj["status"].get("value")
-                                    if status_value and status_value not in statuses:
-                                        statuses.append(status_value)
+                                    if status_value:
+                                        statuses[status_value] = None
+                                        # Nothing left to learn once all common statuses were seen
+                                        if statuses.keys() >= _DEFAULT_STATUS_SET:
+                                            break
                             
                             if statuses:
                                 print(f"Found actual status values for {object_type}: {', '.join(statuses)}")
-                                _valid_status_choices[object_type] = statuses
                                 # Make sure we have common statuses
-                                for common_status in ['active', 'reserved', 'deprecated', 'container']:
-                                    if common_status not in statuses:
-                                        statuses.append(common_status)
-                                return statuses
+                                statuses.update(dict.fromkeys(_DEFAULT_STATUSES))
+                                return list(statuses)
                     
                     # Fall back to using site status value as reference
                     site_status = site["status"]["value"]
                     print(f"Using site status '{site_status}' as reference")
-                    statuses = ['active', 'reserved', 'deprecated', 'container']
+                    statuses = list(_DEFAULT_STATUSES)
                     if site_status not in statuses:
                         statuses.append(site_status)
-                    _valid_status_choices[object_type] = statuses
                     return statuses
     except Exception as e:
         logging.error(f"Error in direct status detection: {str(e)}")
     
-    # Final fallback with standard values
-    fallback = ['active', 'container', 'reserved', 'deprecated']
-    print(f"Using fallback status choices: {', '.join(fallback)}")
-    _valid_status_choices[object_type] = fallback
-    return fallback
+    return None
+
+@functools.lru_cache(maxsize=None)
+def _status_lookup(valid_statuses):
+    """
+    Get the default status and a set of the valid statuses for a tuple of status choices
+    
+    Args:
+        valid_statuses: Tuple of valid status choices, in NetBox order
+        
+    Returns:
+        tuple: (default status, frozenset of valid statuses)
+    """
+    # Default to 'active' if available, otherwise first valid status
+    default_status = 'active' if 'active' in valid_statuses else valid_statuses[0]
+    return default_status, frozenset(valid_statuses)
 
 def determine_prefix_status(prefix_name, comment, valid_statuses=None):
     """
@@ -105,51 +280,32 @@ def determine_prefix_status(prefix_name, comment, valid_statuses=None):
     Args:
         prefix_name: Name of the prefix from Racktables
         comment: Comment for the prefix from Racktables
-        valid_statuses: List of valid status choices in NetBox
+        valid_statuses: Valid status choices in NetBox, in NetBox order; callers
+            classifying many prefixes should pass a tuple so it isn't converted
+            on every call
         
     Returns:
         str: Most appropriate status for the prefix
     """
     # Use default statuses if none provided
     if valid_statuses is None:
-        valid_statuses = ['active', 'container', 'reserved', 'deprecated']
+        valid_statuses = _DEFAULT_STATUSES
     
-    # Default to 'active' if available, otherwise first valid status
-    default_status = 'active' if 'active' in valid_statuses else valid_statuses[0]
+    # Get the default status and a set for the membership tests below
+    default_status, valid_statuses = _status_lookup(tuple(valid_statuses))
     
     # Default to 'reserved' if name/comment are empty
-    if (not prefix_name or prefix_name.strip() == "") and (not comment or comment.strip() == ""):
+    if (not prefix_name or prefix_name.isspace()) and (not comment or comment.isspace()):
         # For empty prefixes, use reserved (if available) or first valid status
         return 'reserved' if 'reserved' in valid_statuses else default_status
     
-    # Determine status based on content patterns
-    lower_name = prefix_name.lower() if prefix_name else ""
-    lower_comment = comment.lower() if comment else ""
-    
-    # Check for hints that the prefix is specifically reserved
-    if any(term in lower_name or term in lower_comment for term in 
-           ['reserved', 'hold', 'future', 'planned']):
-        return 'reserved' if 'reserved' in valid_statuses else default_status
+    # Search name and comment in one pass; the newline keeps terms from matching across both
+    text = (prefix_name or "") + "\n" + (comment or "")
     
-    # Check for hints that the prefix is deprecated
-    if any(term in lower_name or term in lower_comment for term in 
-           ['deprecated', 'obsolete', 'old', 'inactive', 'decommissioned']):
-        return 'deprecated' if 'deprecated' in valid_statuses else default_status
-    
-    # Check for specific hints that the prefix should be a container
-    if any(term in lower_name or term in lower_comment for term in 
-           ['container', 'parent', 'supernet', 'aggregate']):
-        return 'container' if 'container' in valid_statuses else default_status
-    
-    # Check for hints that this is available/unused space
-    if any(term in lower_name or term in lower_comment for term in 
-           ['available', 'unused', 'free', '[here be dragons', '[create network here]', 'unallocated']):
-        return 'container' if 'container' in valid_statuses else default_status
-    
-    # Check for hints that this is actively used
-    if any(term in lower_name or term in lower_comment for term in 
-           ['in use', 'used', 'active', 'production', 'allocated']):
-        return 'active' if 'active' in valid_statuses else default_status
+    # Use the highest priority keyword hint, if the suggested status exists here
+    status = _hinted_status(text)
+    if status is not None:
+        return status if status in valid_statuses else default_status
     
     # When we can't clearly determine from the content, default to 'active' for anything with a name/comment
     # This assumes that if someone took the time to name it, it's likely in use
@@ -5,16 +5,22 @@ Includes support for additional Racktables tables not covered in original migrat
 """
 
 import requests
-import json
-import time
+import atexit
+import logging
+import hashlib
 import sys
 import os
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 # Define BASE_DIR
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 
+# Allow running this file directly as a script (python migration/set_custom_fields.py)
+if __package__ in (None, ""):
+    sys.path.insert(0, BASE_DIR)
+
 # Import configuration from config.py
-sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 from migration.config import NB_HOST, NB_PORT, NB_TOKEN, NB_USE_SSL
 
 # Construct API URL and token from config.py
@@ -23,13 +29,25 @@ if NB_PORT:
     API_URL = f"{API_URL}:{NB_PORT}"
 API_TOKEN = NB_TOKEN
 
+logger = logging.getLogger(__name__)
+
 # Prepare headers for API requests
 HEADERS = {
     "Authorization": f"Token {API_TOKEN}",
-    "Content-Type": "application/json",
     "Accept": "application/json"
 }
 
+# Shared HTTP session so all API calls reuse connections to NetBox.
+# Rate limited (429) and gateway errors are retried with backoff.
+_SESSION = requests.Session()
+_SESSION.headers.update(HEADERS)
+_ADAPTER = HTTPAdapter(pool_connections=4, pool_maxsize=16,
+                       max_retries=Retry(total=3, backoff_factor=0.3,
+                                         status_forcelist=(429, 502, 503, 504)))
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+atexit.register(_SESSION.close)
+
 # Check if config appears to be default values
 def check_config():
     default_token = "0123456789abcdef0123456789abcdef01234567"
@@ -45,9 +63,8 @@ def check_config():
     
     return True
 
-# Function to create a custom field
-def create_custom_field(name, field_type, object_types, description="", required=False, weight=0, label=None):
-    """Create a custom field using the NetBox API with correct format for 4.2.6"""
+def build_custom_field_payload(name, field_type, object_types, description="", required=False, weight=0, label=None):
+    """Build the API payload for a custom field with correct format for 4.2.6"""
     
     # Convert single string to list if needed
     if isinstance(object_types, str):
@@ -67,29 +84,96 @@ def create_custom_field(name, field_type, object_types, description="", required
     if label:
         payload["label"] = label
     
+    return payload
+
+# Function to create a custom field
+def create_custom_field(name, field_type, object_types, description="", required=False, weight=0, label=None):
+    """Create a custom field using the NetBox API with correct format for 4.2.6"""
+    return _post_custom_field(
+        build_custom_field_payload(name, field_type, object_types, description, required, weight, label)
+    )
+
+def _post_custom_field(payload):
+    """Create one custom field from a prepared payload"""
+    name = payload["name"]
+    
     # Send the request
-    print(f"Creating custom field: {name} for {', '.join(object_types)}")
+    logger.debug("Creating custom field: %s for %s", name, payload['object_types'])
     try:
-        response = requests.post(
+        response = _SESSION.post(
             f"{API_URL}/api/extras/custom-fields/",
-            headers=HEADERS,
-            data=json.dumps(payload),
+            json=payload,
             timeout=10
         )
         
         # Check the response
         if response.status_code in (201, 200):
-            print(f"✓ Created custom field: {name}")
+            logger.info("✓ Created custom field: %s", name)
             return True
         else:
-            print(f"✗ Failed to create custom field: {name}")
-            print(f"  Status code: {response.status_code}")
-            print(f"  Response: {response.text}")
+            logger.error("✗ Failed to create custom field: %s (status code %s): %s",
+                         name, response.status_code, response.text)
             return False
     except requests.exceptions.RequestException as e:
-        print(f"✗ Connection error: {str(e)}")
+        logger.error("✗ Connection error: %s", e)
         return False
 
+def _prepare_payload(field):
+    """Build the API payload for a custom field definition below"""
+    return build_custom_field_payload(
+        field["name"],
+        field["type"],
+        field["object_types"],
+        field.get("description", ""),
+        field.get("required", False),
+        field.get("weight", 0),
+        field.get("label")
+    )
+
+def create_custom_fields_bulk(payloads):
+    """
+    Create several custom fields with a single bulk API request
+    
+    NetBox creates all fields of a bulk request or none of them. When a batch
+    is rejected it is split in halves to isolate the invalid fields, which are
+    finally created one at a time to report their errors.
+    
+    Args:
+        payloads: Prepared custom field payloads as in CUSTOM_FIELD_PAYLOADS
+        
+    Returns:
+        int: Number of fields created
+    """
+    if not payloads:
+        return 0
+    if len(payloads) == 1:
+        return int(_post_custom_field(payloads[0]))
+    
+    logger.debug("Creating %s custom fields in one request", len(payloads))
+    try:
+        response = _SESSION.post(
+            f"{API_URL}/api/extras/custom-fields/",
+            json=payloads,
+            timeout=30
+        )
+    except requests.exceptions.RequestException as e:
+        logger.error("✗ Connection error: %s", e)
+        return 0
+    
+    if response.status_code in (201, 200):
+        for payload in payloads:
+            logger.info("✓ Created custom field: %s", payload['name'])
+        return len(payloads)
+    
+    if response.status_code != 400:
+        logger.error("✗ Failed to create %s custom fields (status code %s): %s",
+                     len(payloads), response.status_code, response.text)
+        return 0
+    
+    # Some field in the batch is invalid; narrow it down
+    middle = len(payloads) // 2
+    return create_custom_fields_bulk(payloads[:middle]) + create_custom_fields_bulk(payloads[middle:])
+
 # Original custom fields (keeping these)
 original_custom_fields = [
     # VLAN Group custom fields
@@ -224,38 +308,59 @@ new_custom_fields = [
      "description": "Description of attached file"}
 ]
 
+# API payloads for all custom fields, built once
+CUSTOM_FIELD_PAYLOADS = [_prepare_payload(field) for field in original_custom_fields + new_custom_fields]
+
+def get_existing_custom_field_names():
+    """Get the names of custom fields already defined in NetBox"""
+    try:
+        response = _SESSION.get(
+            f"{API_URL}/api/extras/custom-fields/",
+            params={"brief": 1, "limit": 0},
+            timeout=10
+        )
+        if response.status_code == 200:
+            return set(field["name"] for field in response.json().get("results", []))
+        print(f"✗ Failed to list existing custom fields: {response.status_code}")
+    except requests.exceptions.RequestException as e:
+        print(f"✗ Failed to list existing custom fields: {str(e)}")
+    return set()
+
+def get_netbox_version():
+    """Get the version of the NetBox server, or None if it can't be determined"""
+    try:
+        response = _SESSION.get(f"{API_URL}/api/status/", timeout=10)
+        if response.status_code == 200:
+            return response.json().get("netbox-version")
+    except requests.exceptions.RequestException:
+        pass
+    return None
+
+def get_custom_fields_fingerprint():
+    """Get a stable hash of the names of all custom fields this script creates"""
+    names = sorted(payload["name"] for payload in CUSTOM_FIELD_PAYLOADS)
+    return hashlib.sha256("\n".join(names).encode()).hexdigest()
+
 def main():
-    """Main function to create custom fields"""
+    """
+    Main function to create custom fields
+    
+    Returns:
+        bool: True if all custom fields exist in NetBox afterwards, False otherwise
+    """
     # Verify configuration
     if not check_config():
         return False
     
-    # Combine all custom fields
-    all_custom_fields = original_custom_fields + new_custom_fields
+    # Skip fields that are already defined
+    existing_names = get_existing_custom_field_names()
+    missing_payloads = [payload for payload in CUSTOM_FIELD_PAYLOADS if payload["name"] not in existing_names]
     
-    print(f"Creating {len(all_custom_fields)} custom fields in NetBox...")
+    print(f"{len(CUSTOM_FIELD_PAYLOADS) - len(missing_payloads)} custom fields already exist in NetBox")
+    print(f"Creating {len(missing_payloads)} custom fields in NetBox...")
     
-    success_count = 0
-    failure_count = 0
-    
-    for field in all_custom_fields:
-        success = create_custom_field(
-            field["name"],
-            field["type"],
-            field["object_types"],
-            field.get("description", ""),
-            field.get("required", False),
-            field.get("weight", 0),
-            field.get("label")
-        )
-        
-        if success:
-            success_count += 1
-        else:
-            failure_count += 1
-        
-        # Add a short delay to avoid rate limiting
-        time.sleep(0.5)
+    success_count = create_custom_fields_bulk(missing_payloads)
+    failure_count = len(missing_payloads) - success_count
     
     print(f"\nSummary:")
     print(f"- Successfully created: {success_count}")
@@ -264,7 +369,7 @@ def main():
     # Check MAX_PAGE_SIZE setting
     print("\nChecking MAX_PAGE_SIZE setting...")
     try:
-        response = requests.get(f"{API_URL}/api/users/config/", headers=HEADERS)
+        response = _SESSION.get(f"{API_URL}/api/users/config/", timeout=10)
         if response.status_code == 200:
             config = response.json()
             if 'MAX_PAGE_SIZE' in config and config['MAX_PAGE_SIZE'] == 0:
@@ -280,6 +385,9 @@ def main():
                 print(f"  Response: {response.text}")
     except requests.exceptions.RequestException as e:
         print(f"✗ Failed to check MAX_PAGE_SIZE setting: {str(e)}")
+    
+    return failure_count == 0
         
 if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     main()
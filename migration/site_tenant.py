@@ -2,9 +2,63 @@
 Add site and tenant associations to all NetBox objects
 """
 import os
-import sys
 import logging
-from slugify import slugify
+import functools
+from types import MappingProxyType
+from concurrent.futures import ThreadPoolExecutor
+
+from migration.utils import slugify, record_field
+
+logger = logging.getLogger(__name__)
+
+# Site and tenant IDs resolved by ensure_site_tenant_associations. Plain module
+# state rather than context variables, because migration stages run in worker
+# threads that would not inherit a context set in the main thread.
+_site_tenant_ids = {}
+
+@functools.lru_cache(maxsize=None)
+def _get_or_create_site(netbox, site_name):
+    """
+    Get the ID of a site by name, creating the site if it doesn't exist
+    
+    Results are cached so repeated lookups of the same site cost no API calls.
+    Failures raise and are therefore not cached.
+    
+    Args:
+        netbox: NetBox client instance
+        site_name: Site name to look up
+        
+    Returns:
+        int: ID of the site
+    """
+    site = netbox.dcim.get_site(name=site_name)
+    if site is None:
+        logger.info("Site '%s' not found, creating it...", site_name)
+        site = netbox.dcim.create_site(site_name, slugify(site_name))
+    
+    return record_field(site, 'id')
+
+@functools.lru_cache(maxsize=None)
+def _get_or_create_tenant(netbox, tenant_name):
+    """
+    Get the ID of a tenant by name, creating the tenant if it doesn't exist
+    
+    Results are cached so repeated lookups of the same tenant cost no API calls.
+    Failures raise and are therefore not cached.
+    
+    Args:
+        netbox: NetBox client instance
+        tenant_name: Tenant name to look up
+        
+    Returns:
+        int: ID of the tenant
+    """
+    tenant = netbox.tenancy.get_tenant(name=tenant_name)
+    if tenant is None:
+        logger.info("Tenant '%s' not found, creating it...", tenant_name)
+        tenant = netbox.tenancy.create_tenant(tenant_name, slugify(tenant_name))
+    
+    return record_field(tenant, 'id')
 
 def ensure_site_tenant_associations(netbox, site_name, tenant_name):
     """
@@ -18,88 +72,66 @@ def ensure_site_tenant_associations(netbox, site_name, tenant_name):
     Returns:
         tuple: (site_id, tenant_id) or (None, None) if not available
     """
-    # Set up logging to capture detailed information
-    logging.basicConfig(
-        level=logging.INFO,
-        format='%(asctime)s - %(levelname)s - %(message)s',
-        handlers=[
-            logging.FileHandler("association_debug.log"),
-            logging.StreamHandler(sys.stdout)
-        ]
-    )
-    
     site_id = None
     tenant_id = None
     
-    # Handle site association
-    if site_name:
-        logging.info(f"Looking up site: {site_name}")
-        try:
-            sites = list(netbox.dcim.get_sites(name=site_name))
-            if sites:
-                site = sites[0]
-                # Extract ID based on available format (could be property or dict key)
-                site_id = site.id if hasattr(site, 'id') else site.get('id')
-                logging.info(f"Found site '{site_name}' with ID: {site_id}")
-            else:
-                # Try to create the site if it doesn't exist
-                logging.info(f"Site '{site_name}' not found, creating it...")
-                try:
-                    new_site = netbox.dcim.create_site(site_name, slugify(site_name))
-                    site_id = new_site.id if hasattr(new_site, 'id') else new_site.get('id')
-                    logging.info(f"Created site '{site_name}' with ID: {site_id}")
-                except Exception as e:
-                    logging.error(f"Failed to create site '{site_name}': {str(e)}")
-        except Exception as e:
-            logging.error(f"Error looking up site '{site_name}': {str(e)}")
-    
-    # Handle tenant association
-    if tenant_name:
-        logging.info(f"Looking up tenant: {tenant_name}")
-        try:
-            tenants = list(netbox.tenancy.get_tenants(name=tenant_name))
-            if tenants:
-                tenant = tenants[0]
-                # Extract ID based on available format (could be property or dict key)
-                tenant_id = tenant.id if hasattr(tenant, 'id') else tenant.get('id')
-                logging.info(f"Found tenant '{tenant_name}' with ID: {tenant_id}")
-            else:
-                # Try to create the tenant if it doesn't exist
-                logging.info(f"Tenant '{tenant_name}' not found, creating it...")
-                try:
-                    new_tenant = netbox.tenancy.create_tenant(tenant_name, slugify(tenant_name))
-                    tenant_id = new_tenant.id if hasattr(new_tenant, 'id') else new_tenant.get('id')
-                    logging.info(f"Created tenant '{tenant_name}' with ID: {tenant_id}")
-                except Exception as e:
-                    logging.error(f"Failed to create tenant '{tenant_name}': {str(e)}")
-        except Exception as e:
-            logging.error(f"Error looking up tenant '{tenant_name}': {str(e)}")
+    # Resolve site and tenant concurrently; each is a separate NetBox round-trip
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        site_future = executor.submit(_get_or_create_site, netbox, site_name) if site_name else None
+        tenant_future = executor.submit(_get_or_create_tenant, netbox, tenant_name) if tenant_name else None
+        
+        # Handle site association
+        if site_future:
+            logger.info("Looking up site: %s", site_name)
+            try:
+                site_id = site_future.result()
+                logger.info("Using site '%s' with ID: %s", site_name, site_id)
+            except Exception as e:
+                logger.error("Failed to look up or create site '%s': %s", site_name, e)
+        
+        # Handle tenant association
+        if tenant_future:
+            logger.info("Looking up tenant: %s", tenant_name)
+            try:
+                tenant_id = tenant_future.result()
+                logger.info("Using tenant '%s' with ID: %s", tenant_name, tenant_id)
+            except Exception as e:
+                logger.error("Failed to look up or create tenant '%s': %s", tenant_name, e)
     
-    # Save to environment variables for consistent access
+    # Remember the IDs for get_site_tenant_params, and export them to the
+    # environment for scripts that read them from there
     if site_id:
+        _site_tenant_ids['site'] = str(site_id)
         os.environ['NETBOX_SITE_ID'] = str(site_id)
     if tenant_id:
+        _site_tenant_ids['tenant'] = str(tenant_id)
         os.environ['NETBOX_TENANT_ID'] = str(tenant_id)
+    get_site_tenant_params.cache_clear()
     
     return site_id, tenant_id
 
+@functools.lru_cache(maxsize=1)
 def get_site_tenant_params():
     """
     Get site and tenant parameters for API calls
     
+    The IDs only change in ensure_site_tenant_associations, which clears this
+    cache, so they are looked up once rather than on every call. IDs given in
+    the environment are used when none were resolved in this process.
+    
     Returns:
-        dict: Parameters for site and tenant to be passed to API calls
+        Mapping: Read-only parameters for site and tenant to be passed to API calls
     """
     params = {}
     
-    # Get site ID from environment or global variable
-    site_id = os.environ.get('NETBOX_SITE_ID')
+    # Get site ID resolved in this process or from the environment
+    site_id = _site_tenant_ids.get('site') or os.environ.get('NETBOX_SITE_ID')
     if site_id:
         params['site'] = site_id
     
-    # Get tenant ID from environment or global variable
-    tenant_id = os.environ.get('NETBOX_TENANT_ID')
+    # Get tenant ID resolved in this process or from the environment
+    tenant_id = _site_tenant_ids.get('tenant') or os.environ.get('NETBOX_TENANT_ID')
     if tenant_id:
         params['tenant'] = tenant_id
     
-    return params
+    return MappingProxyType(params)
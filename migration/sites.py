@@ -1,14 +1,12 @@
 """
 Site and rack related functions for the Racktables to NetBox migration
 """
-from slugify import slugify
-
-from racktables_netbox_migration.utils import get_db_connection, get_cursor
-from racktables_netbox_migration.db import (
-    getRowsAtSite, getRacksAtRow, getAtomsAtRack, getRackHeight, getTags
+from migration.utils import get_db_connection, get_cursor, bulk_create, slugify
+from migration.db import (
+    getRowsAtSite, getRacksAtRow, getRackHeight, getTags
 )
-from racktables_netbox_migration.config import (
-    SITE_NAME_LENGTH_THRESHOLD, TARGET_SITE, TARGET_TENANT, TARGET_TENANT_ID
+from migration.config import (
+    SITE_NAME_LENGTH_THRESHOLD, TARGET_SITE, TARGET_TENANT_ID
 )
 
 def create_sites_and_racks(netbox):
@@ -30,59 +28,84 @@ def create_sites_and_racks(netbox):
         print(f"Site filtering enabled - only processing target site: {TARGET_SITE}")
         sites_to_process = [(site['id'], site['name'], '', '', '') for site in existing_sites]
     else:
-        # Get all locations from Racktables
+        # Get all locations from Racktables as tuples, the same shape as above
         with get_db_connection() as connection:
-            with get_cursor(connection) as cursor:
+            with get_cursor(connection, dict_rows=False) as cursor:
                 cursor.execute("SELECT id, name, label, asset_no, comment FROM Object WHERE objtype_id=1562")
                 sites_to_process = cursor.fetchall()
     
+    # Fetch the existing NetBox sites once instead of looking up each site by name
+    netbox_site_ids = {site.name: site.id for site in netbox.dcim.get_sites()}
+    
+    # Sites to migrate racks for, and the sites missing in NetBox
+    sites_to_migrate = []
+    new_sites = []
+    
     for site_data in sites_to_process:
-        site_id = site_data["id"] if isinstance(site_data, dict) else site_data[0]
-        site_name = site_data["name"] if isinstance(site_data, dict) else site_data[1]
-        site_label = site_data["label"] if isinstance(site_data, dict) else site_data[2]
-        site_asset_no = site_data["asset_no"] if isinstance(site_data, dict) else site_data[3]
-        site_comment = site_data["comment"] if isinstance(site_data, dict) else site_data[4]
+        site_id, site_name, site_label, site_asset_no, site_comment = site_data
         
         # Skip if filtering by site and not the target site
         if TARGET_SITE and site_name != TARGET_SITE:
             continue
         
-        # Check if site exists or create it
-        existing_site = netbox.dcim.get_sites(name=site_name)
-        if not existing_site:
+        # Check if site exists or queue it for creation
+        if site_name not in netbox_site_ids:
             # Skip if this is likely a location rather than a site
             if len(site_name) > SITE_NAME_LENGTH_THRESHOLD:
                 print(f"Skipping probable location (address): {site_name}")
                 continue
             
+            new_site = {"name": site_name, "slug": slugify(site_name)}
+            
             # Add tenant parameter if TARGET_TENANT_ID is specified
-            tenant_param = {}
             if TARGET_TENANT_ID:
-                tenant_param = {"tenant": TARGET_TENANT_ID}
+                new_site["tenant"] = TARGET_TENANT_ID
             
             print(f"Creating site: {site_name}")
-            try:
-                netbox.dcim.create_site(site_name, slugify(site_name), **tenant_param)
-            except Exception as e:
-                print(f"Failed to create site {site_name}: {e}")
-                continue
+            new_sites.append(new_site)
         
-        # Process rows in this site
-        create_rows_and_racks(netbox, site_id, site_name)
+        sites_to_migrate.append((site_id, site_name))
+    
+    # Create the missing sites with bulk requests
+    for new_site, site in bulk_create(netbox.dcim.create_sites, new_sites, "site"):
+        netbox_site_ids[new_site["name"]] = site.id
+    
+    # Queue the racks of each site that exists in NetBox, then create them all together
+    rack_queue = []
+    for site_id, site_name in sites_to_migrate:
+        if site_name in netbox_site_ids:
+            create_rows_and_racks(netbox, site_id, site_name, netbox_site_ids[site_name], rack_queue)
+    
+    create_racks(netbox, rack_queue)
 
-def create_rows_and_racks(netbox, site_id, site_name):
+def create_rows_and_racks(netbox, site_id, site_name, netbox_site_id=None, rack_queue=None):
     """
     Create rows and racks for a site
     
+    Racks are collected for the whole site and created with bulk requests.
+    
     Args:
         netbox: NetBox client instance
         site_id: Racktables site ID
         site_name: Site name
+        netbox_site_id: NetBox ID of the site, looked up by name if not given
+        rack_queue: Optional list to append the rack payloads to instead of
+            creating them, so racks of several sites can be created together
     """
+    if netbox_site_id is None:
+        site = netbox.dcim.get_site(name=site_name)
+        netbox_site_id = site.id if site else site_name
+    
+    racks = []
+    
     # Get all rows in this site
-    for row_id, row_name, row_label, row_asset_no, row_comment in getRowsAtSite(site_id):
+    for row in getRowsAtSite(site_id):
+        row_id, row_name = row["id"], row["name"]
+        
         # Process racks in this row
-        for rack_id, rack_name, rack_label, rack_asset_no, rack_comment in getRacksAtRow(row_id):
+        for rack in getRacksAtRow(row_id):
+            rack_id, rack_name, rack_comment = rack["id"], rack["name"], rack["comment"]
+            
             # Get rack height and tags
             rack_tags = getTags("rack", rack_id)
             rack_height = getRackHeight(rack_id)
@@ -93,24 +116,33 @@ def create_rows_and_racks(netbox, site_id, site_name):
             else:
                 rack_name = site_name + "." + rack_name
             
+            new_rack = {
+                "name": rack_name,
+                "comment": rack_comment[:200] if rack_comment else "",
+                "site": netbox_site_id,
+                "u_height": rack_height,
+                "tags": rack_tags
+            }
+            
             # Add tenant parameter if TARGET_TENANT_ID is specified
-            tenant_param = {}
             if TARGET_TENANT_ID:
-                tenant_param = {"tenant": TARGET_TENANT_ID}
+                new_rack["tenant"] = TARGET_TENANT_ID
             
             print(f"Creating rack: {rack_name}")
-            try:
-                # Create the rack
-                rack = netbox.dcim.create_rack(
-                    name=rack_name,
-                    comment=rack_comment[:200] if rack_comment else "",
-                    site_name=site_name,
-                    u_height=rack_height,
-                    tags=rack_tags,
-                    **tenant_param  # Add tenant parameter
-                )
-                
-                # Add rack to global tracking
-                print(f"Created rack {rack_name} (ID: {rack['id']})")
-            except Exception as e:
-                print(f"Failed to create rack {rack_name}: {e}")
+            racks.append(new_rack)
+    
+    if rack_queue is not None:
+        rack_queue.extend(racks)
+    else:
+        create_racks(netbox, racks)
+
+def create_racks(netbox, racks):
+    """
+    Create queued racks in NetBox with bulk requests
+    
+    Args:
+        netbox: NetBox client instance
+        racks: List of rack payload dicts
+    """
+    for new_rack, rack in bulk_create(netbox.dcim.create_racks, racks, "rack"):
+        print(f"Created rack {new_rack['name']} (ID: {rack['id']})")
@@ -1,14 +1,50 @@
 """
 Utility functions for the Racktables to NetBox migration tool
 """
+import functools
+import mmap
 import os
 import pickle
-import time
+import tempfile
 from contextlib import contextmanager
 import pymysql
-from slugify import slugify
+from slugify import slugify as _slugify
 
-from migration.config import DB_CONFIG, STORE_DATA, TARGET_TENANT_ID
+from migration import config
+
+# Number of tag names looked up in a single NetBox request
+TAG_LOOKUP_BATCH_SIZE = 100
+
+# Number of objects sent in a single NetBox bulk create request
+BULK_CREATE_BATCH_SIZE = 100
+
+# Write buffer size for pickled state files
+PICKLE_BUFFER_SIZE = 1 << 20
+
+# State files larger than this many bytes are memory-mapped when loaded
+PICKLE_MMAP_THRESHOLD = 1 << 20
+
+# Tag names ensure_tag_exists has already found or created in NetBox
+_ensured_tags = set()
+
+# The same names are slugified many times over, so remember the results
+slugify = functools.lru_cache(maxsize=4096)(_slugify)
+
+def record_field(record, field):
+    """
+    Read a field of a NetBox record, which may be an object or a dict
+    
+    Args:
+        record: pynetbox record or dict
+        field: Name of the field
+        
+    Returns:
+        The field value, or None if the record doesn't have it
+    """
+    value = getattr(record, field, None)
+    if value is None and isinstance(record, dict):
+        value = record.get(field)
+    return value
 
 def error_log(string):
     """
@@ -20,6 +56,16 @@ def error_log(string):
     with open("errors", "a") as error_file:
         error_file.write(string + "\n")
 
+def verbose_print(message):
+    """
+    Print a per-object progress message if verbose output is enabled
+    
+    Args:
+        message: Message to print
+    """
+    if config.VERBOSE:
+        print(message)
+
 def pickleLoad(filename, default):
     """
     Load data from a pickle file with fallback to default value
@@ -33,6 +79,10 @@ def pickleLoad(filename, default):
     """
     if os.path.exists(filename):
         with open(filename, 'rb') as file:
+            # Unpickle large files straight from a memory map instead of reading them in
+            if os.fstat(file.fileno()).st_size > PICKLE_MMAP_THRESHOLD:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                    return pickle.loads(mapped)
             data = pickle.load(file)
             return data
     return default
@@ -45,9 +95,17 @@ def pickleDump(filename, data):
         filename: Path to pickle file
         data: Data to pickle
     """
-    if STORE_DATA:
-        with open(filename, 'wb') as file:
-            pickle.dump(data, file)
+    if config.STORE_DATA:
+        # Write to a temporary file first so an interrupted run never leaves a truncated file
+        directory = os.path.dirname(os.path.abspath(filename))
+        fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, 'wb', buffering=PICKLE_BUFFER_SIZE) as file:
+                pickle.dump(data, file, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(temp_path, filename)
+        except BaseException:
+            os.unlink(temp_path)
+            raise
 
 @contextmanager
 def get_db_connection():
@@ -59,7 +117,7 @@ def get_db_connection():
     """
     connection = None
     try:
-        connection = pymysql.connect(**DB_CONFIG)
+        connection = pymysql.connect(**config.DB_CONFIG)
         yield connection
     except pymysql.MySQLError as e:
         print(f"Database connection error: {e}")
@@ -69,19 +127,29 @@ def get_db_connection():
             connection.close()
 
 @contextmanager
-def get_cursor(connection):
+def get_cursor(connection, stream=False, dict_rows=True):
     """
     Create a database cursor context manager
     
     Args:
         connection: Database connection
+        stream: Stream rows from the server while iterating instead of loading
+            the whole result into memory. All rows must be consumed before
+            another query is issued on the same connection.
+        dict_rows: Return rows as dicts keyed by column name; when False rows
+            are plain tuples, which is cheaper for single column queries
         
     Yields:
         pymysql.cursors.Cursor: Database cursor
     """
+    if dict_rows:
+        cursor_class = pymysql.cursors.SSDictCursor if stream else None
+    else:
+        cursor_class = pymysql.cursors.SSCursor if stream else pymysql.cursors.Cursor
+    
     cursor = None
     try:
-        cursor = connection.cursor()
+        cursor = connection.cursor(cursor_class)
         yield cursor
     finally:
         if cursor:
@@ -90,33 +158,75 @@ def get_cursor(connection):
 def create_global_tags(netbox, tags):
     """
     Create tags in NetBox if they don't already exist
+
+    Only the requested names are looked up in NetBox, in batches, instead of
+    paging through every tag defined on the server. Missing tags are created
+    with bulk requests.
     
     Args:
         netbox: NetBox client instance
-        tags: Set of tag names to create
+        tags: Iterable of tag names to create
     """
-    # Convert tags from NetBox to a list of names
-    tag_objects = list(netbox.extras.get_tags())
+    # Deduplicate while keeping the original order
+    tag_names = [tag for tag in dict.fromkeys(tags) if tag]
+    if not tag_names:
+        return
+    
     global_tags = set()
+    for start in range(0, len(tag_names), TAG_LOOKUP_BATCH_SIZE):
+        batch = tag_names[start:start + TAG_LOOKUP_BATCH_SIZE]
+        for tag in netbox.extras.get_tags(name=batch, brief=1):
+            name = record_field(tag, 'name')
+            if name is not None:
+                global_tags.add(name)
     
-    for tag in tag_objects:
-        if hasattr(tag, 'name'):
-            global_tags.add(tag.name)
-        elif isinstance(tag, dict) and 'name' in tag:
-            global_tags.add(tag['name'])
+    # Create all missing tags with bulk requests
+    missing_tags = [{"name": tag, "slug": slugify(tag)} for tag in tag_names if tag not in global_tags]
+    bulk_create(netbox.extras.create_tags, missing_tags, "tag")
+
+def bulk_create(create, payloads, label, batch_size=BULK_CREATE_BATCH_SIZE):
+    """
+    Create NetBox objects with bulk requests of up to batch_size objects
     
-    for tag in tags:
-        if tag not in global_tags:
+    NetBox rejects a whole bulk request if any object in it is invalid, so a
+    failed batch is retried one object at a time to create the valid ones and
+    report the errors.
+    
+    Args:
+        create: NetBox wrapper method creating objects from a list of dicts,
+            e.g. netbox.dcim.create_racks
+        payloads: List of object dicts to create
+        label: Object type used in messages, e.g. "rack"
+        batch_size: Maximum number of objects per request
+        
+    Returns:
+        list: (payload, created object) pairs for the objects created
+    """
+    created = []
+    for start in range(0, len(payloads), batch_size):
+        batch = payloads[start:start + batch_size]
+        try:
+            created.extend(zip(batch, create(batch)))
+            continue
+        except Exception as e:
+            print(f"Bulk {label} creation failed, creating {label}s individually: {e}")
+        
+        for payload in batch:
             try:
-                netbox.extras.create_tag(tag, slugify(tag))
+                created.extend(zip([payload], create([payload])))
             except Exception as e:
-                print(f"Error creating tag {tag}: {e}")
-            global_tags.add(tag)
+                name = payload.get('name') or payload.get('model') or payload.get('prefix')
+                error_log(f"Error creating {label} {name}: {str(e)}")
+                print(f"Failed to create {label} {name}: {e}")
+    
+    return created
 
 def ensure_tag_exists(netbox, tag_name):
     """
     Ensure a tag exists in NetBox before using it
     
+    Tags found or created are remembered, so asking again costs no API calls.
+    
     Args:
         netbox: NetBox client instance
         tag_name: Name of the tag
@@ -124,10 +234,13 @@ def ensure_tag_exists(netbox, tag_name):
     Returns:
         bool: True if tag exists or was created, False otherwise
     """
+    if tag_name in _ensured_tags:
+        return True
+    
     try:
         # Check if tag exists
-        tags = list(netbox.extras.get_tags(name=tag_name))
-        if tags:
+        if next(iter(netbox.extras.get_tags(name=tag_name)), None) is not None:
+            _ensured_tags.add(tag_name)
             return True
             
         # Create the tag if it doesn't exist
@@ -137,6 +250,7 @@ def ensure_tag_exists(netbox, tag_name):
             slug=tag_slug
         )
         print(f"Created tag: {tag_name}")
+        _ensured_tags.add(tag_name)
         return True
     except Exception as e:
         print(f"Failed to create tag {tag_name}: {e}")
@@ -155,18 +269,14 @@ def format_prefix_description(prefix_name, tags, comment):
         str: Formatted description string
     """
     # Extract tag names consistently whether they're objects or dicts
-    tag_names = []
-    for tag in tags:
-        if hasattr(tag, 'name'):
-            tag_names.append(tag.name)
-        elif isinstance(tag, dict) and 'name' in tag:
-            tag_names.append(tag['name'])
-    
-    tag_str = ", ".join(tag_names) if tag_names else ""
-    description = f"{prefix_name}"
+    tag_names = (record_field(tag, 'name') for tag in tags)
+    tag_str = ", ".join(name for name in tag_names if name is not None)
+    
+    # Collect the parts and join them once
+    parts = [f"{prefix_name}"]
     if tag_str:
-        description += f" [{tag_str}]"
+        parts.append(f" [{tag_str}]")
     if comment:
-        description += f" - {comment}" if description else comment
-        
-    return description[:200] if description else ""
+        parts.append(f" - {comment}" if parts[0] or tag_str else comment)
+    
+    return "".join(parts)[:200]
@@ -1,9 +1,7 @@
 """
 VLAN-related migration functions
 """
-from slugify import slugify
-
-from racktables_netbox_migration.utils import get_db_connection, get_cursor, pickleDump
+from migration.utils import get_db_connection, get_cursor, pickleDump, bulk_create, slugify
 
 def create_vlan_groups(netbox):
     """
@@ -20,15 +18,15 @@ def create_vlan_groups(netbox):
     # Get existing VLAN groups to avoid duplicates
     existing_vlan_groups = set(vlan_group['name'] for vlan_group in netbox.ipam.get_vlan_groups())
     
+    # VLAN groups missing in NetBox
+    new_vlan_groups = []
+    
     # Get VLAN domains from Racktables
     with get_db_connection() as connection:
-        with get_cursor(connection) as cursor:
+        with get_cursor(connection, stream=True, dict_rows=False) as cursor:
             cursor.execute("SELECT id,description FROM VLANDomain")
-            vlan_domains = cursor.fetchall()
             
-            for row in vlan_domains:
-                domain_id, description = row["id"], row["description"]
-                
+            for domain_id, description in cursor:
                 vlan_domain_id_names[domain_id] = description
                 
                 # Skip if VLAN group already exists
@@ -36,62 +34,63 @@ def create_vlan_groups(netbox):
                     print(f"VLAN group {description} already exists")
                     continue
                 
-                # Create the VLAN group
-                try:
-                    netbox.ipam.create_vlan_group(
-                        name=description, 
-                        slug=slugify(description), 
-                        custom_fields={"VLAN_Domain_ID": str(domain_id)}
-                    )
-                    
-                    print(f"Created VLAN group: {description}")
-                    existing_vlan_groups.add(description)
-                except Exception as e:
-                    print(f"Error creating VLAN group {description}: {e}")
+                new_vlan_groups.append({
+                    "name": description,
+                    "slug": slugify(description),
+                    "custom_fields": {"VLAN_Domain_ID": str(domain_id)}
+                })
+                existing_vlan_groups.add(description)
+    
+    # Create the VLAN groups with bulk requests
+    for vlan_group, _ in bulk_create(netbox.ipam.create_vlan_groups, new_vlan_groups, "VLAN group"):
+        print(f"Created VLAN group: {vlan_group['name']}")
     
     return vlan_domain_id_names
 
-def create_vlans(netbox):
+def create_vlans(netbox, vlan_domain_id_names=None):
     """
     Create VLANs from Racktables in NetBox
     
     Args:
         netbox: NetBox client instance
+        vlan_domain_id_names: Mapping of VLAN domain IDs to names as returned by
+            create_vlan_groups; read from Racktables if not given
     """
     print("Creating VLANs")
     
-    # Get VLAN domain mappings
-    vlan_domain_id_names = {}
-    with get_db_connection() as connection:
-        with get_cursor(connection) as cursor:
-            cursor.execute("SELECT id,description FROM VLANDomain")
-            for row in cursor.fetchall():
-                vlan_domain_id_names[row["id"]] = row["description"]
+    # Map VLAN group names to NetBox IDs once instead of looking up each VLAN's group
+    vlan_group_ids = {vlan_group['name']: vlan_group['id'] for vlan_group in netbox.ipam.get_vlan_groups()}
     
     # Track VLAN mappings for network associations
     network_id_group_name_id = {}
     
-    # Track VLANs by group to ensure unique names
+    # VLANs to create, and a parallel list with the group name and network of each
+    new_vlans = []
+    vlan_networks = []
+    
+    # Track VLANs by group to ensure unique names, and the last numeric suffix
+    # given to each (group, name) pair
     vlans_for_group = {}
+    name_suffixes = {}
     
-    # Process IPv4 and IPv6 VLANs
-    for IP in ("4", "6"):
-        with get_db_connection() as connection:
-            with get_cursor(connection) as cursor:
-                cursor.execute(f"SELECT domain_id,vlan_id,ipv{IP}net_id FROM VLANIPv{IP}")
-                vlans = cursor.fetchall()
+    # Read the domains and both IP families over one connection, streaming the rows as tuples
+    with get_db_connection() as connection:
+        with get_cursor(connection, stream=True, dict_rows=False) as cursor:
+            # Get VLAN domain mappings unless the caller already has them
+            if vlan_domain_id_names is None:
+                cursor.execute("SELECT id,description FROM VLANDomain")
+                vlan_domain_id_names = dict(cursor)
+            
+            # Process IPv4 and IPv6 VLANs
+            for IP in ("4", "6"):
+                # Fetch each VLAN's description in the same query
+                cursor.execute(
+                    f"SELECT v.domain_id, v.vlan_id, v.ipv{IP}net_id, d.vlan_descr "
+                    f"FROM VLANIPv{IP} v "
+                    "LEFT JOIN VLANDescription d ON d.domain_id=v.domain_id AND d.vlan_id=v.vlan_id"
+                )
                 
-                for row in vlans:
-                    domain_id, vlan_id, net_id = row["domain_id"], row["vlan_id"], row[f"ipv{IP}net_id"]
-                    
-                    # Get VLAN description
-                    cursor.execute(
-                        "SELECT vlan_descr FROM VLANDescription WHERE domain_id=%s AND vlan_id=%s", 
-                        (domain_id, vlan_id)
-                    )
-                    result = cursor.fetchone()
-                    vlan_name = result["vlan_descr"] if result else None
-                    
+                for domain_id, vlan_id, net_id, vlan_name in cursor:
                     # Skip if no name available
                     if not vlan_name:
                         continue
@@ -100,36 +99,47 @@ def create_vlans(netbox):
                     vlan_group_name = vlan_domain_id_names[domain_id]
                     
                     # Initialize tracking for this group
-                    if vlan_group_name not in vlans_for_group:
-                        vlans_for_group[vlan_group_name] = set()
+                    group_names = vlans_for_group.setdefault(vlan_group_name, set())
                     
-                    # Ensure unique name within group
+                    # Ensure unique name within group, continuing from the last suffix
+                    # used for this name so repeated collisions don't rescan from 1
                     name = vlan_name
-                    if name in vlans_for_group[vlan_group_name]:
-                        counter = 1
-                        while True:
-                            name = f"{vlan_name}-{counter}"
-                            if name not in vlans_for_group[vlan_group_name]:
-                                break
+                    if name in group_names:
+                        key = (vlan_group_name, vlan_name)
+                        counter = name_suffixes.get(key, 0)
+                        while name in group_names:
                             counter += 1
+                            name = f"{vlan_name}-{counter}"
+                        name_suffixes[key] = counter
                     
-                    # Create the VLAN
-                    try:
-                        created_vlan = netbox.ipam.create_vlan(
-                            group={"name": vlan_group_name},
-                            vid=vlan_id,
-                            vlan_name=name
-                        )
-                        
-                        # Store mapping for network association
-                        network_id_group_name_id[net_id] = (vlan_group_name, name, created_vlan['id'])
-                        
-                        # Track created VLAN name
-                        vlans_for_group[vlan_group_name].add(name)
-                        
-                        print(f"Created VLAN {name} (ID: {vlan_id}) in group {vlan_group_name}")
-                    except Exception as e:
-                        print(f"Error creating VLAN {name} (ID: {vlan_id}): {e}")
+                    # Queue the VLAN for creation
+                    new_vlan = {
+                        "group": vlan_group_ids.get(vlan_group_name),
+                        "vid": vlan_id,
+                        "name": name
+                    }
+                    new_vlans.append(new_vlan)
+                    vlan_networks.append((vlan_group_name, net_id))
+                    
+                    # Track queued VLAN name
+                    group_names.add(name)
+    
+    # Create the VLANs with bulk requests. The created VLANs come back in queue
+    # order, so walk the queue alongside them to find each one's group and network.
+    created_vlans = iter(bulk_create(netbox.ipam.create_vlans, new_vlans, "VLAN"))
+    next_created = next(created_vlans, None)
+    for new_vlan, (vlan_group_name, net_id) in zip(new_vlans, vlan_networks):
+        if next_created is None or next_created[0] is not new_vlan:
+            # Not created; bulk_create already reported the error
+            continue
+        created_vlan = next_created[1]
+        next_created = next(created_vlans, None)
+        name = new_vlan["name"]
+        
+        # Store mapping for network association
+        network_id_group_name_id[net_id] = (vlan_group_name, name, created_vlan['id'])
+        
+        print(f"Created VLAN {name} (ID: {new_vlan['vid']}) in group {vlan_group_name}")
     
     # Save network to VLAN mappings for IP networks creation
     pickleDump('network_id_group_name_id', network_id_group_name_id)
@@ -1,11 +1,9 @@
 """
 Virtual machine creation and management functions
 """
-from slugify import slugify
-
-from racktables_netbox_migration.utils import get_db_connection, get_cursor
-from racktables_netbox_migration.db import getTags
-from racktables_netbox_migration.config import TARGET_SITE, TARGET_SITE_ID, TARGET_TENANT, TARGET_TENANT_ID
+from migration.utils import get_db_connection, get_cursor, slugify
+from migration.db import getTags
+from migration.config import TARGET_SITE_ID, TARGET_TENANT_ID
 
 def create_vms(netbox, create_mounted=True, create_unmounted=True):
     """
@@ -21,7 +21,7 @@ setup(
     ],
     entry_points={
         "console_scripts": [
-            "migrate-racktables=migrate_wrapper:main",
+            "migrate-racktables=migration.migrate:cli",
         ],
     },
     classifiers=[
@@ -325,7 +325,7 @@ setup(
     ],
     entry_points={
         "console_scripts": [
-            "migrate-racktables=migration.migrate:main",
+            "migrate-racktables=migration.migrate:cli",
         ],
     },
     python_requires=">=3.6",